@@ -0,0 +1,83 @@
+import time
+
+
+class TokenBudgetScheduler:
+    """
+    Forms transformer batches by token length instead of a fixed number of texts. Chunk lengths
+    range from table cells to long paragraphs, and a batch is padded to its longest text, so mixed
+    batches spend most of the compute on padding. Queued texts are sorted by token length, the
+    finest possible bucketing, and consecutive ones are batched while the padded size (texts x
+    longest) stays under max_batch_tokens. A text longer than the budget gets a batch of its own.
+    Results are returned in the original order. The queue is everything given to run(), e.g. a
+    schedule_window of TextEntityFinder chunks, so short and long chunks of a whole window are
+    sorted apart, while max_batch_size only limits the texts of one batch.
+
+    Real and padded token counts are collected over all runs, see stats(). unscheduled_padding_waste
+    is the padding the same texts would have had in arrival order batches of max_batch_size.
+    """
+
+    def __init__(self, tokenizer, max_batch_tokens=4096, max_batch_size=64):
+        self.tokenizer = tokenizer
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.texts = 0
+        self.batches = 0
+        self.tokens = 0
+        self.padded_tokens = 0
+        self.unscheduled_padded_tokens = 0
+        self.seconds = 0.0
+
+    def token_lengths(self, texts):
+        # Truncated like in the pipeline, so texts over the model's limit count as its maximum length
+        return [len(ids) for ids in self.tokenizer(texts, add_special_tokens=True, truncation=True)['input_ids']]
+
+    def plan(self, lengths, max_batch_size=None):
+        """Returns batches as lists of indexes to lengths."""
+        max_batch_size = min(max_batch_size or self.max_batch_size, self.max_batch_size)
+        batches, batch = [], []
+        for ind in sorted(range(len(lengths)), key=lambda ind: lengths[ind]):
+            # Sorted by length, so the new text is the longest and sets the padded length of the batch
+            if batch and (len(batch) >= max_batch_size or (len(batch) + 1) * lengths[ind] > self.max_batch_tokens):
+                batches.append(batch)
+                batch = []
+            batch.append(ind)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def run(self, texts, predict, max_batch_size=None):
+        """predict(texts, batch_size=n) is a transformers pipeline or alike. Returns its results in the order of texts."""
+        texts = list(texts)
+        if not texts:
+            return []
+        lengths = self.token_lengths(texts)
+        results = [None] * len(texts)
+        for batch in self.plan(lengths, max_batch_size):
+            start = time.perf_counter()
+            predictions = predict([texts[ind] for ind in batch], batch_size=len(batch))
+            self.seconds += time.perf_counter() - start
+            for ind, prediction in zip(batch, predictions):
+                results[ind] = prediction
+            self.batches += 1
+            self.tokens += sum(lengths[ind] for ind in batch)
+            self.padded_tokens += len(batch) * max(lengths[ind] for ind in batch)
+        size = min(max_batch_size or self.max_batch_size, self.max_batch_size)
+        for start in range(0, len(lengths), size):
+            group = lengths[start:start + size]
+            self.unscheduled_padded_tokens += len(group) * max(group)
+        self.texts += len(texts)
+        return results
+
+    def stats(self):
+        return {'texts': self.texts, 'batches': self.batches, 'tokens': self.tokens, 'padded_tokens': self.padded_tokens,
+                'padding_waste': round(1 - self.tokens / self.padded_tokens, 4) if self.padded_tokens else 0.0,
+                'unscheduled_padding_waste': round(1 - self.tokens / self.unscheduled_padded_tokens, 4) if self.unscheduled_padded_tokens else 0.0,
+                'tokens_per_sec': round(self.tokens / self.seconds, 1) if self.seconds else None}
+
+    def summary(self):
+        stats = self.stats()
+        return (f"{stats['texts']} texts in {stats['batches']} batches, {stats['padding_waste']:.1%} of the batched tokens padding "
+                f"({stats['unscheduled_padding_waste']:.1%} without scheduling), {stats['tokens_per_sec']} tokens/sec.")
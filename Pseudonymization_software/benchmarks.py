@@ -0,0 +1,391 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+import fitz
+from docx import Document
+from docx.enum.section import WD_ORIENT
+from docx.shared import Pt
+from faker import Faker
+
+from chunker import construct_text_chunks, iter_text_chunks
+from layout_repeats import RepeatedLayoutDetector
+from memory import RunTimeMemory
+from readers import DirReader, FileReader
+
+
+class SyntheticCorpus:
+    """
+    Generates a reproducible corpus of Finnish contract-style PDF and DOCX files with names,
+    phone numbers, e-mails, companies and cities from Faker fi_FI. The paragraphs are also saved
+    with their entity positions to labelled_sample.jsonl, which the NER benchmarks use.
+    """
+    SENTENCES = [
+        "Tämä urakkasopimus on tehty {date} tilaajan {ORGANIZATION} ja urakoitsijan {ORGANIZATION2} välillä.",
+        "Tilaajan yhteyshenkilö on {PERSON}, puh. {PHONE_NUMBER}, sähköposti {EMAIL_ADDRESS}.",
+        "Urakoitsijan vastaava työnjohtaja {PERSON} vastaa työmaan työturvallisuudesta kohteessa {LOCATION}.",
+        "Valvojana toimii {PERSON} ({ORGANIZATION}), joka tavoitetaan numerosta {PHONE_NUMBER}.",
+        "Laskut toimitetaan osoitteeseen {EMAIL_ADDRESS} viimeistään kuukauden viidentenä päivänä.",
+    ]
+    FILLER = [
+        "Urakka-aika alkaa, kun tilaaja on antanut kirjallisen aloitusluvan.",
+        "Maksuerät maksetaan maksuerätaulukon mukaisesti 21 päivän maksuehdolla.",
+        "Sopimukseen sovelletaan rakennusurakan yleisiä sopimusehtoja YSE 1998.",
+        "Lisä- ja muutostyöt on sovittava kirjallisesti ennen niiden aloittamista.",
+        "Erimielisyydet ratkaistaan ensisijaisesti osapuolten välisin neuvotteluin.",
+        "Urakoitsija vastaa aliurakoitsijoidensa töistä kuin omistaan.",
+        "Työmaakokouksia pidetään kahden viikon välein, ellei toisin sovita.",
+        "Takuuaika on kaksi vuotta vastaanottotarkastuksesta lukien.",
+    ]
+    PARAGRAPHS_PER_PAGE = 6
+
+    def __init__(self, output_dir, seed=42, pdf_count=20, docx_count=10, page_range=(1, 30)):
+        self.output_dir = output_dir
+        self.seed = seed
+        self.pdf_count = pdf_count
+        self.docx_count = docx_count
+        self.page_range = page_range
+        self.random = random.Random(seed)
+        self.faker = Faker('fi_FI')
+        self.faker.seed_instance(seed)
+        self.labelled = []
+
+    def _entity(self, label):
+        if label == "PERSON":
+            return self.faker.name()
+        elif label == "PHONE_NUMBER":
+            return self.faker.phone_number()
+        elif label == "EMAIL_ADDRESS":
+            return self.faker.email()
+        elif label == "ORGANIZATION":
+            return self.faker.company()
+        elif label == "LOCATION":
+            return self.faker.city()
+        return self.faker.date()
+
+    def paragraph(self):
+        """Returns (text, [(start, end, label)]) for one paragraph with entities and filler."""
+        sentence, entities = "", []
+        template = self.random.choice(self.SENTENCES)
+        pos = 0
+        while True:
+            start = template.find("{", pos)
+            if start == -1:
+                sentence += template[pos:]
+                break
+            end = template.index("}", start)
+            sentence += template[pos:start]
+            label = template[start + 1:end].rstrip("0123456789")
+            value = self._entity(label)
+            if label != "date":
+                entities.append((len(sentence), len(sentence) + len(value), label))
+            sentence += value
+            pos = end + 1
+        fillers = self.random.sample(self.FILLER, self.random.randint(1, 3))
+        if self.random.random() < 0.5:
+            return " ".join([sentence] + fillers), entities
+        prefix = " ".join(fillers) + " "
+        return prefix + sentence, [(start + len(prefix), end + len(prefix), label) for start, end, label in entities]
+
+    def _document_paragraphs(self):
+        page_count = self.random.randint(*self.page_range)
+        landscape = self.random.random() < 0.2
+        pages = []
+        for _ in range(page_count):
+            page = [self.paragraph() for _ in range(self.PARAGRAPHS_PER_PAGE)]
+            self.labelled.extend(page)
+            pages.append([text for text, _ in page])
+        return pages, landscape
+
+    def _write_pdf(self, path, pages, landscape):
+        width, height = fitz.paper_size("a4-l" if landscape else "a4")
+        chars_per_line = int((width - 144) / 5)
+        with fitz.open() as doc:
+            for paragraphs in pages:
+                page = doc.new_page(width=width, height=height)
+                y = 72
+                for text in paragraphs:
+                    line = ""
+                    for word in text.split(" "):
+                        if line and len(line) + len(word) + 1 > chars_per_line:
+                            page.insert_text((72, y), line, fontsize=10, fontname="helv")
+                            y += 13
+                            line = word
+                        else:
+                            line = f"{line} {word}" if line else word
+                    page.insert_text((72, y), line, fontsize=10, fontname="helv")
+                    y += 26  # empty line between paragraphs
+            doc.save(path)
+
+    def _write_docx(self, path, pages, landscape):
+        document = Document()
+        section = document.sections[0]
+        if landscape:
+            section.orientation = WD_ORIENT.LANDSCAPE
+            section.page_width, section.page_height = section.page_height, section.page_width
+        for page_ind, paragraphs in enumerate(pages):
+            for text in paragraphs:
+                document.add_paragraph(text).runs[0].font.size = Pt(10)
+                document.add_paragraph("")
+            if page_ind < len(pages) - 1:
+                document.add_page_break()
+        document.save(path)
+
+    def generate(self):
+        if not os.path.exists(self.output_dir):
+            os.makedirs(self.output_dir)
+        for ind in range(self.pdf_count):
+            pages, landscape = self._document_paragraphs()
+            # Files are spread to subfolders, so folder listing has some depth to walk
+            folder = os.path.join(self.output_dir, f"kohde_{ind % 3}") if ind % 3 else self.output_dir
+            os.makedirs(folder, exist_ok=True)
+            self._write_pdf(os.path.join(folder, f"urakkasopimus_{ind}.pdf"), pages, landscape)
+        for ind in range(self.docx_count):
+            pages, landscape = self._document_paragraphs()
+            self._write_docx(os.path.join(self.output_dir, f"liite_{ind}.docx"), pages, landscape)
+        with open(os.path.join(self.output_dir, "labelled_sample.jsonl"), 'w', encoding='utf-8') as file:
+            for text, entities in self.labelled:
+                file.write(json.dumps({'text': text, 'entities': entities}, ensure_ascii=False) + "\n")
+        print(f"Generated {self.pdf_count} PDF and {self.docx_count} DOCX files to {self.output_dir}.")
+
+
+def load_labelled_sample(path, limit=None):
+    """Reads labelled_sample.jsonl as [(text, [(start, end, label)])]."""
+    samples = []
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            row = json.loads(line)
+            samples.append((row['text'], [tuple(entity) for entity in row['entities']]))
+            if limit and len(samples) >= limit:
+                break
+    return samples
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, None where it can't be measured."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)  # bytes on macOS, KB elsewhere
+    except ImportError:
+        try:
+            import psutil
+            return round(psutil.Process().memory_info().peak_wset / (1024 * 1024), 1)
+        except Exception:
+            return None
+
+
+def benchmark_readers(corpus_dir, workers=1):
+    memory = RunTimeMemory()
+    memory.clear_memory()
+    file_reader = FileReader(memory=memory)
+    results = {}
+
+    start = time.perf_counter()
+    paths = list(DirReader.iter_files(corpus_dir, max_depth=11, allowed_types=file_reader.get_allowed_file_types(), workers=workers))
+    results['dir_listing'] = {'files': len(paths), 'seconds': round(time.perf_counter() - start, 4), 'peak_rss_mb': peak_rss_mb()}
+
+    start = time.perf_counter()
+    legacy_paths = DirReader.get_all_files_from_dir(corpus_dir, max_depth=11)
+    results['dir_listing_legacy'] = {'files': len(legacy_paths), 'seconds': round(time.perf_counter() - start, 4)}
+
+    per_type = {}
+    start = time.perf_counter()
+    for path in paths:
+        file_start = time.perf_counter()
+        file_reader.process_file(path)
+        stats = per_type.setdefault(os.path.splitext(path)[1].lower(), {'files': 0, 'pages': 0, 'bytes': 0, 'seconds': 0.0})
+        stats['files'] += 1
+        stats['pages'] += len(memory.file_data[path].pages) if path in memory.file_data else 0
+        stats['bytes'] += os.path.getsize(path)
+        stats['seconds'] += time.perf_counter() - file_start
+    read_seconds = time.perf_counter() - start
+    for stats in per_type.values():
+        stats['pages_per_sec'] = round(stats['pages'] / stats['seconds'], 1) if stats['seconds'] else None
+        stats['mb_per_sec'] = round(stats['bytes'] / (1024 * 1024) / stats['seconds'], 2) if stats['seconds'] else None
+        stats['seconds'] = round(stats['seconds'], 4)
+    total_pages = sum(stats['pages'] for stats in per_type.values())
+    total_bytes = sum(stats['bytes'] for stats in per_type.values())
+    results['process_file'] = {'seconds': round(read_seconds, 4), 'pages': total_pages, 'pages_per_sec': round(total_pages / read_seconds, 1),
+                               'mb_per_sec': round(total_bytes / (1024 * 1024) / read_seconds, 2), 'per_type': per_type,
+                               'peak_rss_mb': peak_rss_mb()}
+
+    chunk_count, chunk_chars = 0, 0
+    start = time.perf_counter()
+    for path in memory.file_data:
+        for chunk in iter_text_chunks(memory.file_data[path].iter_texts()):
+            chunk_count += 1
+            chunk_chars += len(chunk)
+    chunk_seconds = time.perf_counter() - start
+    results['chunk_construction'] = {'seconds': round(chunk_seconds, 4), 'chunks': chunk_count, 'chars': chunk_chars,
+                                     'chars_per_sec': round(chunk_chars / chunk_seconds, 1) if chunk_seconds else None,
+                                     'peak_rss_mb': peak_rss_mb()}
+
+    # The chunks PseudoProcess._construct_temp_text_chunks gives NER, with repeated headers and footers once per document
+    layout_repeats = RepeatedLayoutDetector()
+    chunk_count, chunk_chars = 0, 0
+    start = time.perf_counter()
+    for path in memory.file_data:
+        for chunk in construct_text_chunks(memory.file_data[path], layout_repeats):
+            chunk_count += 1
+            chunk_chars += len(chunk)
+    chunk_seconds = time.perf_counter() - start
+    results['construct_temp_text_chunks'] = {'seconds': round(chunk_seconds, 4), 'chunks': chunk_count, 'chars': chunk_chars,
+                                             'chars_per_sec': round(chunk_chars / chunk_seconds, 1) if chunk_seconds else None,
+                                             'peak_rss_mb': peak_rss_mb()}
+    return results
+
+
+def precision_recall_f1(predicted, gold):
+    """Exact span match scores for sets of (sample_ind, start, end, label)."""
+    true_pos = len(predicted & gold)
+    precision = true_pos / len(predicted) if predicted else 0.0
+    recall = true_pos / len(gold) if gold else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {'precision': round(precision, 4), 'recall': round(recall, 4), 'f1': round(f1, 4)}
+
+
+def benchmark_transformer_backends(sample_path, backends, limit=None, batch_size=16):
+    """Accuracy and latency of the TransformerRecognizer with each inference backend on the labelled sample."""
+    from entity_recognizer import TextEntityFinder
+    samples = load_labelled_sample(sample_path, limit)
+    results = {}
+    predictions = {}
+    for backend in backends:
+        finder = TextEntityFinder(memory=RunTimeMemory(), inference_backend=backend)
+        recognizer = finder.transformers_recognizer
+        labels = sorted(set(recognizer.label2presidio.values()))
+        # Only the labels the model can produce are scored, e-mails and phones are found by regex recognizers
+        gold = {(ind, start, end, label) for ind, (_, entities) in enumerate(samples) for start, end, label in entities if label in labels}
+
+        start = time.perf_counter()
+        recognizer.analyze(samples[0][0], entities=labels)  # loads, and for ONNX exports, the model
+        load_seconds = time.perf_counter() - start
+
+        latencies = []
+        predicted = set()
+        for ind, (text, _) in enumerate(samples):
+            start = time.perf_counter()
+            found = recognizer.analyze(text, entities=labels)
+            latencies.append(time.perf_counter() - start)
+            predicted.update((ind, res.start, res.end, res.entity_type) for res in found)
+
+        start = time.perf_counter()
+        texts = [text for text, _ in samples]
+        recognizer.predict_batch(texts, batch_size=batch_size)
+        for text in texts:
+            recognizer.analyze(text, entities=labels)
+        recognizer.clear_predictions()
+        batch_seconds = time.perf_counter() - start
+
+        latencies.sort()
+        results[backend] = {'samples': len(samples), 'load_seconds': round(load_seconds, 2),
+                            'latency_ms_mean': round(sum(latencies) / len(latencies) * 1000, 2),
+                            'latency_ms_p50': round(latencies[len(latencies) // 2] * 1000, 2),
+                            'latency_ms_p95': round(latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] * 1000, 2),
+                            'batched_texts_per_sec': round(len(texts) / batch_seconds, 1),
+                            'peak_rss_mb': peak_rss_mb(), **precision_recall_f1(predicted, gold)}
+        predictions[backend] = predicted
+
+    # How close the other backends are to the first one, 1.0 means identical detections
+    reference = backends[0]
+    for backend in backends[1:]:
+        union = predictions[backend] | predictions[reference]
+        results[backend][f'agreement_with_{reference}'] = round(len(predictions[backend] & predictions[reference]) / len(union), 4) if union else 1.0
+    return results
+
+
+def benchmark_detection_profiles(sample_path, profiles, limit=None, batch_size=16, confidence_score=0.5):
+    """Throughput and accuracy of TextEntityFinder detection with each detection profile on the labelled sample."""
+    from entity_recognizer import TextEntityFinder
+    samples = load_labelled_sample(sample_path, limit)
+    texts = [text for text, _ in samples]
+    total_chars = sum(len(text) for text in texts)
+    gold = {(ind, start, end, label) for ind, (_, entities) in enumerate(samples) for start, end, label in entities}
+    results = {}
+    for profile in profiles:
+        finder = TextEntityFinder(memory=RunTimeMemory(), detection_profile=profile)
+        start = time.perf_counter()
+        finder.detect_entities_batch(texts[:1], batch_size=batch_size)  # loads the models of the profile
+        load_seconds = time.perf_counter() - start
+        finder.batch_scheduler.reset_stats()
+
+        start = time.perf_counter()
+        all_words = finder.detect_entities_batch(texts, batch_size=batch_size)
+        seconds = time.perf_counter() - start
+
+        # Scored like register_entities filters them, without the minimum word length
+        predicted = {(ind, word['start'], word['end'], word['entity_type']) for ind, words in enumerate(all_words) for word in words
+                     if word['entity_type'] in TextEntityFinder.to_censor_ents and (word['score'] is None or word['score'] > confidence_score)}
+        per_label = {label: precision_recall_f1({item for item in predicted if item[3] == label}, {item for item in gold if item[3] == label})['recall']
+                     for label in sorted({item[3] for item in gold})}
+        results[profile] = {'samples': len(samples), 'load_seconds': round(load_seconds, 2), 'seconds': round(seconds, 3),
+                            'chunks_per_sec': round(len(texts) / seconds, 1), 'chars_per_sec': round(total_chars / seconds, 1),
+                            'transformer_chunks': sum(1 for text in texts if profile != "fast" or finder.might_contain_names(text)),
+                            'recall_per_label': per_label, 'peak_rss_mb': peak_rss_mb(), **precision_recall_f1(predicted, gold),
+                            'transformer_batches': finder.batch_scheduler.stats()}
+    return results
+
+
+def save_results(results, output_path, name, config):
+    report = {'benchmark': name, 'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"), 'python': platform.python_version(),
+              'platform': platform.platform(), 'cpu_count': os.cpu_count(), 'config': config, 'results': results}
+    with open(output_path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f"Results saved to {output_path}.")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the pseudonymization pipeline.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    corpus_parser = subparsers.add_parser("corpus", help="Generate the synthetic corpus.")
+    corpus_parser.add_argument("--corpus-dir", default="bench_corpus")
+    corpus_parser.add_argument("--seed", type=int, default=42)
+    corpus_parser.add_argument("--pdf", type=int, default=20)
+    corpus_parser.add_argument("--docx", type=int, default=10)
+    corpus_parser.add_argument("--max-pages", type=int, default=30)
+
+    readers_parser = subparsers.add_parser("readers", help="Time DirReader, FileReader.process_file and chunk construction.")
+    readers_parser.add_argument("--corpus-dir", default="bench_corpus")
+    readers_parser.add_argument("--workers", type=int, default=1, help="Threads for folder listing.")
+    readers_parser.add_argument("--output", default="bench_readers.json")
+
+    backends_parser = subparsers.add_parser("transformer-backends", help="Compare NER inference backends on the labelled sample.")
+    backends_parser.add_argument("--sample", default=os.path.join("bench_corpus", "labelled_sample.jsonl"))
+    backends_parser.add_argument("--backends", nargs="+", default=["pytorch", "onnx", "onnx-int8"])
+    backends_parser.add_argument("--limit", type=int, default=500, help="Number of labelled paragraphs to use.")
+    backends_parser.add_argument("--batch-size", type=int, default=16)
+    backends_parser.add_argument("--output", default="bench_transformer_backends.json")
+
+    profiles_parser = subparsers.add_parser("profiles", help="Compare detection profiles on the labelled sample.")
+    profiles_parser.add_argument("--sample", default=os.path.join("bench_corpus", "labelled_sample.jsonl"))
+    profiles_parser.add_argument("--profiles", nargs="+", default=["fast", "balanced", "thorough"])
+    profiles_parser.add_argument("--limit", type=int, default=500, help="Number of labelled paragraphs to use.")
+    profiles_parser.add_argument("--batch-size", type=int, default=16)
+    profiles_parser.add_argument("--output", default="bench_profiles.json")
+
+    args = parser.parse_args()
+    if args.command == "corpus":
+        SyntheticCorpus(args.corpus_dir, seed=args.seed, pdf_count=args.pdf, docx_count=args.docx, page_range=(1, args.max_pages)).generate()
+    elif args.command == "readers":
+        results = benchmark_readers(args.corpus_dir, workers=args.workers)
+        save_results(results, args.output, "readers", vars(args))
+        print(json.dumps(results, indent=2))
+    elif args.command == "transformer-backends":
+        results = benchmark_transformer_backends(args.sample, args.backends, limit=args.limit, batch_size=args.batch_size)
+        save_results(results, args.output, "transformer-backends", vars(args))
+        print(json.dumps(results, indent=2))
+    elif args.command == "profiles":
+        results = benchmark_detection_profiles(args.sample, args.profiles, limit=args.limit, batch_size=args.batch_size)
+        save_results(results, args.output, "profiles", vars(args))
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
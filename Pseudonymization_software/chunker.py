@@ -0,0 +1,176 @@
+class TextChunk(str):
+    """Chunk text that also knows where it starts in the document, works anywhere a string does."""
+
+    def __new__(cls, text, start=0):
+        chunk = super().__new__(cls, text)
+        chunk.start = start
+        return chunk
+
+    def __reduce__(self):
+        return self.__class__, (str(self), self.start)
+
+
+class TokenAwareChunker:
+    """
+    Packs paragraphs into chunks of at most max_tokens model tokens, so the transformer gets neither
+    single words nor texts it has to truncate. Paragraphs longer than the limit are split at word
+    starts, with overlap_tokens tokens shared by the neighbouring parts so entities at the cut are
+    seen whole in one of them. Needs a fast (Rust) tokenizer for the offset mapping.
+
+    Chunk offsets are positions in the document made by joining the paragraphs with blank lines.
+    """
+    SEPARATOR = "\n\n"
+
+    def __init__(self, tokenizer, max_tokens=None, overlap_tokens=32):
+        self.tokenizer = tokenizer
+        if max_tokens is None:
+            model_max = getattr(tokenizer, 'model_max_length', 512)
+            if model_max > 100000:  # tokenizers without a limit report a huge placeholder
+                model_max = 512
+            max_tokens = model_max - tokenizer.num_special_tokens_to_add()
+        if overlap_tokens >= max_tokens // 2:
+            raise ValueError("TokenAwareChunker: overlap_tokens must be less than half of max_tokens.")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+
+    def token_offsets(self, text):
+        return self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)['offset_mapping']
+
+    def chunk_stream(self, paragraphs):
+        """Yields TextChunks for an iterable of paragraphs, e.g. iter_text_chunks."""
+        parts, parts_start, parts_tokens = [], 0, 0
+        position = 0
+        for paragraph in paragraphs:
+            offsets = self.token_offsets(paragraph)
+            if parts and parts_tokens + len(offsets) > self.max_tokens:
+                yield TextChunk(self.SEPARATOR.join(parts), parts_start)
+                parts, parts_tokens = [], 0
+            if len(offsets) > self.max_tokens:
+                yield from self._split_paragraph(paragraph, offsets, position)
+            else:
+                if not parts:
+                    parts_start = position
+                parts.append(paragraph)
+                parts_tokens += len(offsets)
+            position += len(paragraph) + len(self.SEPARATOR)
+        if parts:
+            yield TextChunk(self.SEPARATOR.join(parts), parts_start)
+
+    @staticmethod
+    def _word_start(offsets, ind, lowest, highest=None):
+        """
+        Moves ind back to the first token of a word, no lower than lowest, so words aren't cut in half.
+        Without a word start there, the next one before highest is used, and highest itself if there is
+        none. Without highest, ind is returned as it is.
+        """
+        def starts_word(candidate):
+            return offsets[candidate][0] > offsets[candidate - 1][1]  # whitespace before the token
+
+        for candidate in range(ind, lowest - 1, -1):
+            if starts_word(candidate):
+                return candidate
+        if highest is None:
+            return ind
+        for candidate in range(ind + 1, highest):
+            if starts_word(candidate):
+                return candidate
+        return highest
+
+    def _split_paragraph(self, paragraph, offsets, position):
+        first = 0
+        while True:
+            text_start = offsets[first][0] if first else 0
+            end = first + self.max_tokens
+            if end >= len(offsets):
+                yield TextChunk(paragraph[text_start:], position + text_start)
+                return
+            end = self._word_start(offsets, end, first + self.max_tokens // 2)
+            yield TextChunk(paragraph[text_start:offsets[end][0]], position + text_start)
+            # The overlap is shorter, or left out, when no word starts inside it
+            first = self._word_start(offsets, end - self.overlap_tokens, first + 1, end) if self.overlap_tokens else end
+
+
+def iter_text_chunks(span_texts):
+    """
+    Yields the same chunks as splitting "\n".join(stripped span texts) on "\n\n", without
+    building the whole text. A blank line can only come from an empty span or from a span
+    containing one, so the pending text is split only after those.
+    """
+    parts = []
+    split_pending = False
+    for span_text in span_texts:
+        stripped = span_text.strip()
+        parts.append(stripped)
+        if split_pending:
+            *complete, rest = "\n".join(parts).split("\n\n")
+            for row in complete:
+                if len(row) > 1:
+                    yield row
+            parts = [rest]
+        split_pending = not stripped or "\n\n" in stripped
+    if parts:
+        for row in "\n".join(parts).split("\n\n"):
+            if len(row) > 1:
+                yield row
+
+
+def construct_text_chunks(store, layout_repeats=None):
+    """Chunks of one SpanStore for NER. With a RepeatedLayoutDetector, repeated text comes once, after the body."""
+    if layout_repeats is None:
+        return list(iter_text_chunks(store.iter_texts()))
+    body_texts, repeated_texts = layout_repeats.split_texts(store)
+    return list(iter_text_chunks(body_texts)) + list(iter_text_chunks(repeated_texts))
+
+
+def iter_batches(chunks, batch_size):
+    """Groups a stream of chunks to lists of batch_size chunks."""
+    batch = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _same_entity(word, other):
+    return word['entity_type'] == other['entity_type'] and 'start' in word and 'start' in other
+
+
+def _remove_neighbour_duplicates(previous_words, words):
+    """Entities found in both overlapping chunks are kept once. A part of an entity cut at a chunk
+    border is dropped when the neighbour chunk found the whole entity."""
+    kept_previous = [word for word in previous_words
+                     if not any(_same_entity(word, other) and other['start'] <= word['start'] and word['end'] <= other['end']
+                                and (other['start'], other['end']) != (word['start'], word['end']) for other in words)]
+    kept = [word for word in words
+            if not any(_same_entity(word, other) and other['start'] <= word['start'] and word['end'] <= other['end']
+                       for other in previous_words)]
+    return kept_previous, kept
+
+
+def merge_chunk_detections(detections):
+    """
+    Takes (chunk, words) pairs in chunk order and yields the words of each chunk with their start and
+    end moved to document offsets and the duplicates of overlapping TextChunks removed. Plain string
+    chunks are passed through as they are. Words are yielded one chunk late, as the next chunk is
+    needed for the duplicate check.
+    """
+    previous = None
+    for chunk, words in detections:
+        chunk_start = getattr(chunk, 'start', None)
+        if chunk_start is not None:
+            for word in words:
+                if 'start' in word:
+                    word['start'] += chunk_start
+                    word['end'] += chunk_start
+        if previous is not None:
+            previous_chunk, previous_words = previous
+            if chunk_start is not None and getattr(previous_chunk, 'start', None) is not None \
+                    and previous_chunk.start + len(previous_chunk) > chunk_start:
+                previous_words, words = _remove_neighbour_duplicates(previous_words, words)
+            yield previous_words
+        previous = (chunk, words)
+    if previous is not None:
+        yield previous[1]
@@ -0,0 +1,111 @@
+import json
+import os
+import time
+
+
+class DetectionJournal:
+    """
+    Append-only JSON lines file of found entities for recovering an interrupted run. Only the
+    entities found in each chunk are appended, instead of rewriting every entity so far. Writes
+    are flushed right away but fsynced in batches, after fsync_every entities or fsync_interval
+    seconds, and on sync() and close().
+
+    replay() reads the entities back, a line cut off by a crash is skipped. compact() rewrites the
+    journal with each UID once. The journal covers one run: reset() starts it again at the start
+    of a run and discard() deletes it when the run is finished, so detected words of earlier runs
+    don't stay on disk.
+    """
+
+    def __init__(self, journal_path="safe_approach_journal.jsonl", fsync_every=256, fsync_interval=2.0):
+        self.journal_path = journal_path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def append(self, entities):
+        if not entities:
+            return
+        if self._file is None:
+            self._open()
+        # Transformer scores are numpy floats, they are stored as plain floats
+        self._file.write("".join(json.dumps(entity, ensure_ascii=False, default=float) + "\n" for entity in entities))
+        self._file.flush()
+        self._unsynced += len(entities)
+        if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.sync()
+
+    def _open(self):
+        # A line cut off by a crash is ended, so it doesn't break the first new entry
+        ends_with_newline = True
+        if os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) > 0:
+            with open(self.journal_path, 'rb') as file:
+                file.seek(-1, os.SEEK_END)
+                ends_with_newline = file.read(1) == b"\n"
+        self._file = open(self.journal_path, 'a', encoding='utf-8')
+        if not ends_with_newline:
+            self._file.write("\n")
+
+    def sync(self):
+        if self._file is not None and self._unsynced:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    def replay(self):
+        """Yields the journaled entities in the order they were found."""
+        if not os.path.exists(self.journal_path):
+            return
+        self.sync()
+        with open(self.journal_path, 'r', encoding='utf-8') as file:
+            for line_num, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    print(Warning(f"DetectionJournal: Skipped broken line {line_num} in {self.journal_path}."))
+
+    def has_entries(self):
+        """True when an unfinished run has left entities in the journal."""
+        if self._file is not None:
+            self._file.flush()
+        return os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) > 0
+
+    def reset(self, entities=()):
+        """Starts the journal again with only the given entities, e.g. the ones already found in this session."""
+        self._rewrite(entities)
+
+    def discard(self):
+        self.close()
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+    def compact(self):
+        """Rewrites the journal with only the first entry of each UID. Returns the number of entries kept."""
+        unique = {}
+        for entity in self.replay():
+            unique.setdefault(entity.get('UID') or entity['word'] + entity['entity_type'], entity)
+        self._rewrite(unique.values())
+        return len(unique)
+
+    def _rewrite(self, entities):
+        # Written to a temporary file and swapped in, so a crash leaves either the old or the new journal
+        was_open = self._file is not None
+        self.close()
+        temp_path = self.journal_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            file.write("".join(json.dumps(entity, ensure_ascii=False, default=float) + "\n" for entity in entities))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.journal_path)
+        if was_open:
+            self._open()
@@ -0,0 +1,81 @@
+import atexit
+import os
+import pickle
+import sqlite3
+import tempfile
+import zlib
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+
+class DocumentStore(MutableMapping):
+    """
+    Dict-like {path: SpanStore} for RunTimeMemory.file_data that keeps only max_resident documents
+    in memory. Every stored document is written to a SQLite file right away, the least recently
+    used ones are dropped from memory and read back on access. Values are treated as immutable,
+    so changing a fetched document doesn't change the stored one, store a new value instead.
+    """
+
+    def __init__(self, max_resident=64, db_path=None):
+        self.max_resident = max_resident
+        self._owns_file = db_path is None
+        if db_path is None:
+            file_handle, db_path = tempfile.mkstemp(prefix="document_store_", suffix=".sqlite")
+            os.close(file_handle)
+        self.db_path = db_path
+        # Data is only needed during the run, so durability is traded for write speed
+        self.connection = sqlite3.connect(db_path, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=OFF")
+        self.connection.execute("PRAGMA synchronous=OFF")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS documents (path TEXT PRIMARY KEY, data BLOB)")
+        self._keys = dict.fromkeys(row[0] for row in self.connection.execute("SELECT path FROM documents ORDER BY rowid"))
+        self._resident = OrderedDict()
+        if self._owns_file:
+            atexit.register(self.close)  # temp file holds document text, it shouldn't outlive the run
+
+    def __setitem__(self, path, document):
+        blob = zlib.compress(pickle.dumps(document, protocol=pickle.HIGHEST_PROTOCOL))
+        self.connection.execute("INSERT OR REPLACE INTO documents (path, data) VALUES (?, ?)", (path, blob))
+        self._keys[path] = None
+        self._keep_resident(path, document)
+
+    def __getitem__(self, path):
+        if path in self._resident:
+            self._resident.move_to_end(path)
+            return self._resident[path]
+        if path not in self._keys:
+            raise KeyError(path)
+        row = self.connection.execute("SELECT data FROM documents WHERE path = ?", (path,)).fetchone()
+        document = pickle.loads(zlib.decompress(row[0]))
+        self._keep_resident(path, document)
+        return document
+
+    def __delitem__(self, path):
+        del self._keys[path]
+        self._resident.pop(path, None)
+        self.connection.execute("DELETE FROM documents WHERE path = ?", (path,))
+
+    def __contains__(self, path):
+        return path in self._keys
+
+    def __iter__(self):
+        return iter(list(self._keys))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _keep_resident(self, path, document):
+        self._resident[path] = document
+        self._resident.move_to_end(path)
+        while len(self._resident) > self.max_resident:
+            self._resident.popitem(last=False)
+
+    def clear(self):
+        self.connection.execute("DELETE FROM documents")
+        self._keys = {}
+        self._resident = OrderedDict()
+
+    def close(self):
+        self.connection.close()  # closing twice is a no-op
+        if self._owns_file and os.path.exists(self.db_path):
+            os.remove(self.db_path)
@@ -0,0 +1,176 @@
+import math
+import re
+
+from docx import Document
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+
+
+class DocxLayoutReader:
+    """
+    Reads a .docx file natively with python-docx and produces the same page structure as
+    FileReader.read_pdf_file_with_meta: [{'page', 'content', 'orientation', 'size'}].
+
+    python-docx has no layout engine, so the layout is synthetic: lines are wrapped with an
+    average glyph width, tables are placed column by column and pages break at the section
+    margins. Headers and footers of the first section are repeated on every page, like in a
+    converted PDF. Text and its reading order are exact, coordinates are approximations.
+    """
+    CHAR_WIDTH = 0.5  # average glyph width relative to font size
+    LINE_SPACING = 1.2
+    CELL_GAP = 4.0
+    DEFAULT_FONT = "Calibri"
+    DEFAULT_SIZE = 11.0
+    A4_SIZE = (595.3, 841.9)
+
+    def __init__(self, file_path):
+        self.document = Document(file_path)
+        section = self.document.sections[0] if len(self.document.sections) > 0 else None
+        self.width = self._pt(section.page_width if section else None, self.A4_SIZE[0])
+        self.height = self._pt(section.page_height if section else None, self.A4_SIZE[1])
+        self.left = self._pt(section.left_margin if section else None, 72.0)
+        self.right = self.width - self._pt(section.right_margin if section else None, 72.0)
+        self.top = self._pt(section.top_margin if section else None, 72.0)
+        self.bottom = self.height - self._pt(section.bottom_margin if section else None, 72.0)
+        normal_font = self.document.styles['Normal'].font
+        self.default_font = normal_font.name or self.DEFAULT_FONT
+        self.default_size = normal_font.size.pt if normal_font.size else self.DEFAULT_SIZE
+        self.header_lines = self._header_footer_lines(section.header) if section else []
+        self.footer_lines = self._header_footer_lines(section.footer) if section else []
+        self.pages = []
+        self.y = 0.0
+
+    @staticmethod
+    def _pt(length, default):
+        return float(length.pt) if length is not None else default
+
+    def read(self):
+        self._new_page()
+        for block in self._iter_blocks(self.document.element.body, self.document):
+            if isinstance(block, Paragraph):
+                self._place_lines(self._wrap_paragraph(block, self.right - self.left), self.left)
+            else:
+                self._place_table(block)
+        return self.pages
+
+    @staticmethod
+    def _iter_blocks(parent_element, parent):
+        # python-docx lists paragraphs and tables separately, the body element keeps their order
+        for child in parent_element.iterchildren():
+            tag = child.tag.rsplit('}', 1)[-1]
+            if tag == 'p':
+                yield Paragraph(child, parent)
+            elif tag == 'tbl':
+                yield Table(child, parent)
+
+    def _segments(self, paragraph):
+        """Merges consecutive runs with the same font and size, as runs often split words."""
+        style_font = paragraph.style.font if paragraph.style is not None else None
+        font_default = (style_font.name if style_font is not None else None) or self.default_font
+        size_default = style_font.size.pt if style_font is not None and style_font.size else self.default_size
+        segments = []
+        # Hyperlinks hold their own runs, e-mail addresses are often inside them
+        runs = [run for item in paragraph.iter_inner_content() for run in (item.runs if hasattr(item, 'runs') else [item])]
+        for run in runs:
+            if not run.text:
+                continue
+            font = run.font.name or font_default
+            size = run.font.size.pt if run.font.size else size_default
+            if segments and segments[-1][1] == font and segments[-1][2] == size:
+                segments[-1][0] += run.text
+            else:
+                segments.append([run.text, font, size])
+        return segments, font_default, size_default
+
+    def _wrap_paragraph(self, paragraph, width):
+        """Returns lines as (line_height, [(text, font, size, x0_offset, x1_offset)])."""
+        segments, font_default, size_default = self._segments(paragraph)
+        if not any(text.strip() for text, _, _ in segments):
+            # Empty paragraphs become blank spans, which is what separates text chunks later on
+            return [(size_default * self.LINE_SPACING, [(' ', font_default, size_default, 0.0, size_default * self.CHAR_WIDTH)])]
+        lines = []
+        line, line_size, x = [], 0.0, 0.0
+        for text, font, size in segments:
+            span_text, span_x0 = "", x
+            for token in re.findall(r'\s+|\S+', text):
+                token_width = len(token) * size * self.CHAR_WIDTH
+                if token.strip() and x > 0 and x + token_width > width:
+                    if span_text.strip():
+                        line.append((span_text.rstrip(), font, size, span_x0, x))
+                    lines.append((line_size * self.LINE_SPACING, line))
+                    line, line_size, x = [], 0.0, 0.0
+                    span_text, span_x0 = "", 0.0
+                if not token.strip() and x == 0:
+                    continue  # wrapped lines don't start with whitespace
+                span_text += token
+                x += token_width
+                line_size = max(line_size, size)
+            if span_text.strip():
+                line.append((span_text, font, size, span_x0, x))
+        if line:
+            lines.append((line_size * self.LINE_SPACING, line))
+        return lines
+
+    def _header_footer_lines(self, header_footer):
+        # A linked first-section header has no definition, reading it would add one to the document
+        if header_footer.is_linked_to_previous:
+            return []
+        return self._wrap_blocks(header_footer.iter_inner_content(), self.right - self.left)
+
+    def _wrap_blocks(self, blocks, width):
+        lines = []
+        for block in blocks:
+            if isinstance(block, Paragraph):
+                lines.extend(self._wrap_paragraph(block, width))
+            else:
+                for row in block.rows:
+                    for cell in row.cells:
+                        lines.extend(self._wrap_blocks(cell.iter_inner_content(), width))
+        return lines
+
+    def _new_page(self):
+        orientation = 'landscape' if self.width > self.height else 'portrait'
+        self.page = {'page': len(self.pages), 'content': [], 'orientation': orientation, 'size': (self.width, self.height)}
+        self.pages.append(self.page)
+        # Headers go above the top margin and footers below the bottom margin, outside the text area
+        header_height = sum(height for height, _ in self.header_lines)
+        self._write_lines(self.header_lines, self.left, max(self.top - header_height, 0.0))
+        self._write_lines(self.footer_lines, self.left, self.bottom + (self.height - self.bottom) / 3)
+        self.y = self.top
+
+    def _write_lines(self, lines, x_origin, y):
+        for line_height, spans in lines:
+            for text, font, size, x0, x1 in spans:
+                location = (round(x_origin + x0, 1), round(y, 1), round(x_origin + x1, 1), round(y + size, 1))
+                self.page['content'].append({'type': 'text', 'text': text, 'font': font, 'size': round(size, 1), 'location': location})
+            y += line_height
+        return y
+
+    def _place_lines(self, lines, x_origin):
+        for line in lines:
+            if self.y + line[0] > self.bottom and self.y > self.top:
+                self._new_page()
+            self.y = self._write_lines([line], x_origin, self.y)
+
+    def _place_table(self, table):
+        text_width = self.right - self.left
+        for row in table.rows:
+            cells = []
+            for cell in row.cells:
+                if not cells or cell._tc is not cells[-1]._tc:  # merged cells repeat the same cell
+                    cells.append(cell)
+            if not cells:
+                continue
+            column_width = text_width / len(cells)
+            cell_lines = [self._wrap_blocks(cell.iter_inner_content(), max(column_width - self.CELL_GAP, 1.0)) for cell in cells]
+            row_height = max(sum(height for height, _ in lines) for lines in cell_lines)
+            if row_height > self.bottom - self.top:
+                # Too tall for any page, fall back to placing the cells one after another
+                for col, lines in enumerate(cell_lines):
+                    self._place_lines(lines, self.left + col * column_width)
+                continue
+            if self.y + row_height > self.bottom:
+                self._new_page()
+            for col, lines in enumerate(cell_lines):
+                self._write_lines(lines, self.left + col * column_width, self.y)
+            self.y += math.ceil(row_height)
@@ -0,0 +1,107 @@
+import re
+
+import numpy as np
+from rapidfuzz import fuzz
+from rapidfuzz import process as rf_process
+
+
+class EntityClusterer:
+    """
+    Groups found entities whose words are spelled alike (e.g. "Meikäläinen Oy" and "Meikalainen Oy")
+    so they can share one replacement. Words are normalized and deduplicated first, then compared
+    only inside blocks of the same entity type and first character (blocking="first_char") or
+    length bucket (blocking="length"), all pairs of a block at once with rapidfuzz cdist using all
+    cores. Pairs scoring at least similarity_threshold are joined with union-find.
+    """
+    ROWS_PER_CDIST = 2000  # limits the size of one score matrix
+    DEFAULT_THRESHOLD = 75  # also the default of main menu option 5
+
+    def __init__(self, similarity_threshold=DEFAULT_THRESHOLD, blocking="first_char", length_bucket=4, workers=-1, scorer=fuzz.WRatio):
+        if blocking not in ("first_char", "length"):
+            raise ValueError("EntityClusterer: blocking must be 'first_char' or 'length'.")
+        self.similarity_threshold = similarity_threshold
+        self.blocking = blocking
+        self.length_bucket = length_bucket
+        self.workers = workers
+        self.scorer = scorer
+
+    @staticmethod
+    def normalize_word(word):
+        """Normalize a word by removing special characters and handling split words."""
+        normalized = re.sub(r'[\-\s]+', '', word)  # Remove hyphens and spaces
+        return normalized.lower()  # Convert to lowercase to standardize
+
+    def _block_key(self, entity_type, normalized):
+        if self.blocking == "first_char":
+            return entity_type, normalized[:1]
+        return entity_type, len(normalized) // self.length_bucket
+
+    def _neighbour_key(self, key):
+        # Length buckets are also compared with the next bucket, so lengths around a bucket border meet
+        return (key[0], key[1] + 1) if self.blocking == "length" else None
+
+    def cluster(self, entities):
+        """
+        Returns (cluster id per entity, best match per entity as (score, normalized word) or None).
+        Entities with the same type and normalized word are always in the same cluster.
+        """
+        word_ids = {}  # {(entity_type, normalized): id}
+        entity_word_ids = []
+        for entity in entities:
+            key = (entity['entity_type'], self.normalize_word(entity['word']))
+            entity_word_ids.append(word_ids.setdefault(key, len(word_ids)))
+        words = list(word_ids)
+
+        blocks = {}
+        for word_id, (entity_type, normalized) in enumerate(words):
+            blocks.setdefault(self._block_key(entity_type, normalized), []).append(word_id)
+
+        parents = list(range(len(words)))
+
+        def find(word_id):
+            while parents[word_id] != word_id:
+                parents[word_id] = parents[parents[word_id]]  # path halving
+                word_id = parents[word_id]
+            return word_id
+
+        best_matches = [None] * len(words)
+        for key, query_ids in blocks.items():
+            choice_ids = query_ids + blocks.get(self._neighbour_key(key), [])
+            if len(choice_ids) < 2:
+                continue
+            choices = [words[word_id][1] for word_id in choice_ids]
+            for row_start in range(0, len(query_ids), self.ROWS_PER_CDIST):
+                row_ids = query_ids[row_start:row_start + self.ROWS_PER_CDIST]
+                scores = rf_process.cdist([words[word_id][1] for word_id in row_ids], choices, scorer=self.scorer,
+                                          score_cutoff=self.similarity_threshold, workers=self.workers)
+                for row, col in zip(*np.nonzero(scores)):
+                    query_id, choice_id = row_ids[row], choice_ids[col]
+                    if query_id == choice_id:
+                        continue
+                    score = round(float(scores[row, col]), 1)
+                    if best_matches[query_id] is None or score > best_matches[query_id][0]:
+                        best_matches[query_id] = (score, words[choice_id][1])
+                    root_query, root_choice = find(query_id), find(choice_id)
+                    if root_query != root_choice:
+                        parents[max(root_query, root_choice)] = min(root_query, root_choice)
+
+        return [find(word_id) for word_id in entity_word_ids], [best_matches[word_id] for word_id in entity_word_ids]
+
+    def map_similar(self, entities):
+        """
+        Returns copies of the entities where every cluster uses the replacement of its first entity,
+        with 'normalized_word', 'cluster_id', 'similarity_score' and 'similarity_score_with' added.
+        """
+        cluster_ids, best_matches = self.cluster(entities)
+        cluster_replacements = {}
+        mapped = []
+        for entity, cluster_id, best_match in zip(entities, cluster_ids, best_matches):
+            entity = dict(entity)
+            cluster_replacements.setdefault(cluster_id, entity.get('replacement'))
+            entity['replacement'] = cluster_replacements[cluster_id]
+            entity['normalized_word'] = self.normalize_word(entity['word'])
+            entity['cluster_id'] = cluster_id
+            entity['similarity_score'] = best_match[0] if best_match else None
+            entity['similarity_score_with'] = best_match[1] if best_match else None
+            mapped.append(entity)
+        return mapped
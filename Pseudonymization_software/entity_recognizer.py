@@ -1,16 +1,26 @@
-from transformers import pipeline
-from transformers import AutoTokenizer, AutoModelForTokenClassification
-from rapidfuzz import process as rf_process
-from rapidfuzz import fuzz
+from functools import cached_property
 import pandas as pd
-import spacy
 import re
 import os
+import copy
 import csv
+import json
+import hashlib
 from presidio_analyzer import AnalyzerEngine, EntityRecognizer, RecognizerResult
-from presidio_analyzer.nlp_engine import NlpArtifacts,NlpEngineProvider
+from presidio_analyzer.nlp_engine import NlpArtifacts
+from presidio_analyzer.predefined_recognizers import EmailRecognizer, PhoneRecognizer
 from faker import Faker
 
+from model_registry import ModelRegistry
+from ner_cache import NERResultCache
+from chunker import iter_batches, merge_chunk_detections
+from detection_journal import DetectionJournal
+from entity_clustering import EntityClusterer
+from replacement_engine import ReplacementEngine
+from pseudonym_pool import PseudonymPool
+from keyed_pseudonyms import KeyedPseudonymGenerator
+from batch_scheduler import TokenBudgetScheduler
+
 
 class TransformerRecognizer(EntityRecognizer):
 
@@ -19,26 +29,55 @@ class TransformerRecognizer(EntityRecognizer):
         mapping_labels,
         aggregation_strategy="simple",
         supported_language="fi",
-        ignore_labels=["O", "MISC"]):
-
-        # inits transformers pipeline for given mode or path
-        self.pipeline = pipeline("token-classification", model=model_id_or_path, aggregation_strategy=aggregation_strategy, ignore_labels=ignore_labels)
+        ignore_labels=["O", "MISC"],
+        backend="pytorch",
+        scheduler=None):
+
+        # transformers pipeline for given model or path is loaded through the registry on first use
+        self.model_id_or_path = model_id_or_path
+        self.aggregation_strategy = aggregation_strategy
+        self.ignore_labels = ignore_labels
+        self.backend = backend  # "pytorch", "onnx" or "onnx-int8"
+        self.scheduler = scheduler  # TokenBudgetScheduler for predict_batch, fixed size batches without
         # map labels to presidio labels
         self.label2presidio = mapping_labels
+        # {text: pipeline output} prefetched with predict_batch, used by analyze instead of a new pipeline call
+        self._predictions = {}
         # passes entities from model into parent class
         super().__init__(supported_entities=list(self.label2presidio.values()), supported_language=supported_language)
 
     def load(self) -> None:
-        """No loading is required."""
+        """No loading is required, the pipeline is loaded lazily."""
         pass
 
+    @property
+    def pipeline(self):
+        return ModelRegistry.get_token_pipeline(self.model_id_or_path, self.aggregation_strategy, self.ignore_labels, self.backend)
+
+    def predict_batch(self, texts, batch_size=16):
+        """
+        Runs the pipeline for many texts at once, analyze() then uses these predictions for the same texts.
+        With a scheduler, batches are formed from all the texts under its token budget and batch_size is not used.
+        """
+        unique_texts = list(dict.fromkeys(texts))
+        if not unique_texts:
+            return
+        if self.scheduler is not None:
+            predictions = self.scheduler.run(unique_texts, self.pipeline)
+        else:
+            predictions = self.pipeline(unique_texts, batch_size=batch_size)
+        self._predictions = dict(zip(unique_texts, predictions))
+
+    def clear_predictions(self):
+        self._predictions = {}
+
     def analyze(self, text: str, entities = None, nlp_artifacts: NlpArtifacts = None):
         """
         Extracts entities using Transformers pipeline
         """
         results = []
 
-        predicted_entities = self.pipeline(text)
+        predicted_entities = self._predictions[text] if text in self._predictions else self.pipeline(text)
         if len(predicted_entities) > 0:
             for e in predicted_entities:
                 if(e['entity_group'] not in self.label2presidio):
@@ -57,9 +96,19 @@ class TextEntityFinder:
     available_models = ["Kansallisarkisto/finbert-ner", "iguanodon-ai/bert-base-finnish-uncased-ner"]
     finnish_entity_mapping = {"EMAIL_ADDRESS":"SÄHKÖPOSTIOSOITE", "LOCATION":"SIJAINTI", "NRP":"HENK_KUVAUS",
                               "PERSON":"HENKILÖ", "PHONE_NUMBER":"PUHELINNUMERO", "URL":"URL", "ORGANIZATION":"YRITYS",}
-
-
-    def __init__(self, memory, model_ind=0):
+    # "fast": e-mail and phone regexes, and the transformer only on chunks passing the prefilter. No spaCy.
+    # "balanced": the composite analyzer only. "thorough": the composite analyzer and a second Presidio pass for e-mails and phones.
+    detection_profiles = ["fast", "balanced", "thorough"]
+    # A capitalized word inside a sentence, a digit or a lone capitalized word (e.g. a place in a signature block),
+    # chunks without any of these rarely have names, places or companies
+    name_candidate_pattern = re.compile(r"[^\s.!?:]\s+[A-ZÅÄÖ]|\d|^\s*[A-ZÅÄÖ]\S*\s*$")
+
+
+    def __init__(self, memory, model_ind=0, inference_backend="pytorch", ner_cache=None, journal_path="safe_approach_journal.jsonl",
+                 pseudonym_seed=None, replacement_mode="pool", project_secret=None, detection_profile="thorough", max_batch_tokens=4096,
+                 schedule_window=256):
+        if detection_profile not in TextEntityFinder.detection_profiles:
+            raise ValueError(f"TextEntityFinder: Unknown detection profile {detection_profile}, use one of {TextEntityFinder.detection_profiles}.")
         self.memory = memory
         self.configuration = TextEntityFinder.configuration
         self.fin_model = TextEntityFinder.available_models[model_ind]
@@ -68,30 +117,77 @@ class TextEntityFinder:
         else:
             self.mapping_labels = {"PER": "PERSON", 'LOC': 'LOCATION', 'ORG': "ORGANIZATION"}
         self.lang = 'fi'
+        self.inference_backend = inference_backend  # ONNX backends need optimum[onnxruntime]
+        self.ner_cache = ner_cache  # NERResultCache, chunks found in it are not sent to the models
+        self.detection_profile = detection_profile  # speed vs accuracy, see detection_profiles
+        self.max_batch_tokens = max_batch_tokens  # padded tokens in one transformer batch
+        # Chunks detected together, the batch scheduler forms the transformer batches from all of them
+        self.schedule_window = schedule_window
+        self.journal = DetectionJournal(journal_path)  # with safe_approach, found entities are appended here
 
-        # method and model initialization
-        self.spacy_nlp = spacy.load("fi_core_news_lg", disable=["tok2vec", "tagger", "parser", "attribute_ruler", "lemmatizer"])  # disable other than ner for performance
-        self.tokenizer = AutoTokenizer.from_pretrained(self.fin_model)
-        self.ner_model = AutoModelForTokenClassification.from_pretrained(self.fin_model)
-        self.trans_nlp = pipeline("token-classification", model=self.ner_model, tokenizer=self.tokenizer, aggregation_strategy="simple")
-        self.trad_provider = NlpEngineProvider(nlp_configuration=self.configuration)
-        self.trad_nlp_engine = self.trad_provider.create_engine()
-        self.trad_analyzer = AnalyzerEngine(nlp_engine=self.trad_nlp_engine, supported_languages=[self.lang])
-        self.comp_provider = NlpEngineProvider(nlp_configuration=self.configuration)
-        self.comp_nlp_engine = self.comp_provider.create_engine()
-        # Pass the created NLP engine and supported_languages to the AnalyzerEngine
-        self.comp_analyzer = AnalyzerEngine(nlp_engine=self.comp_nlp_engine, supported_languages=self.lang)
-        self.transformers_recognizer = TransformerRecognizer(self.fin_model, self.mapping_labels)
-        self.comp_analyzer.registry.add_recognizer(self.transformers_recognizer)
+        # Models are loaded on first use through ModelRegistry, see the properties below
+        self.spacy_disabled_pipes = ["tok2vec", "tagger", "parser", "attribute_ruler", "lemmatizer"]  # disable other than ner for performance
 
         self.faker = Faker('fi_FI')
         # variables
         self.to_keep_list = []  # list of words to keep in text
         self.false_positive_words = []  # automatically removed false positives
         # Result variables
-        self.found_words = self.memory.found_entities  # [{'UID': text+entity_type, 'word': text, 'entity_type': entity_type, 'ner_method': ner_method, 'score':score, 'replacement': replacement}]
-        self.replacements = []  #
+        self.found_words = self.memory.found_entities  # EntityRegistry of [{'UID': text+entity_type, 'word': text, 'entity_type': entity_type, 'ner_method': ner_method, 'score':score, 'replacement': replacement}]
+        self.replacements = set()  # every replacement in use, shared with the pseudonym pool
+        # Replacement values are pre-generated per entity type, a seed gives the same values in every run
+        make_value = lambda faker, entity_type: "^" + self._get_fake_var(entity_type, faker).lower()
+        self.pseudonym_pool = PseudonymPool(make_value, seed=pseudonym_seed, used=self.replacements)
+        # "keyed" derives each replacement from the word and a project secret, the same in every run and process
+        if replacement_mode == "keyed":
+            self.keyed_pseudonyms = KeyedPseudonymGenerator(make_value, secret=project_secret, used=self.replacements)
+        elif replacement_mode == "pool":
+            self.keyed_pseudonyms = None
+        else:
+            raise ValueError(f"TextEntityFinder: Unknown replacement mode {replacement_mode}, use 'pool' or 'keyed'.")
         self.entity_counters = {}  # To keep track of entity counts {type: int}
+        self._engine = None  # ReplacementEngine for anonymize_text
+        self._engine_key = None
+
+    @property
+    def spacy_nlp(self):
+        return ModelRegistry.get_spacy(self.configuration['models'][0]['model_name'])
+
+    @property
+    def tokenizer(self):
+        return ModelRegistry.get_tokenizer(self.fin_model)
+
+    @property
+    def ner_model(self):
+        return ModelRegistry.get_token_model(self.fin_model, self.inference_backend)
+
+    @property
+    def trans_nlp(self):
+        return ModelRegistry.get_token_pipeline(self.fin_model, aggregation_strategy="simple", backend=self.inference_backend)
+
+    @cached_property
+    def trad_analyzer(self):
+        return AnalyzerEngine(nlp_engine=ModelRegistry.get_nlp_engine(self.configuration), supported_languages=[self.lang])
+
+    @cached_property
+    def batch_scheduler(self):
+        return TokenBudgetScheduler(self.tokenizer, max_batch_tokens=self.max_batch_tokens)
+
+    @cached_property
+    def transformers_recognizer(self):
+        return TransformerRecognizer(self.fin_model, self.mapping_labels, backend=self.inference_backend, scheduler=self.batch_scheduler)
+
+    @cached_property
+    def comp_analyzer(self):
+        # Pass the shared NLP engine and supported_languages to the AnalyzerEngine
+        comp_analyzer = AnalyzerEngine(nlp_engine=ModelRegistry.get_nlp_engine(self.configuration), supported_languages=self.lang)
+        comp_analyzer.registry.add_recognizer(self.transformers_recognizer)
+        return comp_analyzer
+
+    @cached_property
+    def regex_recognizers(self):
+        # Same recognizers as in the Presidio registry, used directly so the fast profile doesn't load spaCy
+        return [EmailRecognizer(supported_language=self.lang), PhoneRecognizer(supported_language=self.lang)]
 
     def set_update_to_keep_list(self, to_keep_words, method='add'):
         if type(to_keep_words) != list:
@@ -107,8 +203,14 @@ class TextEntityFinder:
         else:
             print(Warning(ValueError("Unsupported method specified. Use 'add' or 'update'.")))
             return
-        # Now, filter self.found_words to remove any items with words in the to_keep list
-        self.found_words = [item for item in self.found_words if item['word'] not in self.to_keep_list]
+        # Now, filter self.found_words to remove any items with words in the to_keep list. Done in place, so memory sees it too
+        self.found_words[:] = [item for item in self.found_words if item['word'] not in self.to_keep_list]
+
+    def entity_set_version(self):
+        """Short hash of the detection setup, files found with another setup need a new NER run."""
+        setup = {'model': self.fin_model, 'backend': self.inference_backend, 'profile': self.detection_profile, 'entities': TextEntityFinder.DEFAULT_ANONYM_ENTITIES,
+                 'to_censor': TextEntityFinder.to_censor_ents, 'to_keep': sorted(self.to_keep_list)}
+        return hashlib.sha256(json.dumps(setup, sort_keys=True).encode('utf-8')).hexdigest()[:16]
 
     def remove_duplicate_entities(self):
         unique = {}
@@ -116,31 +218,32 @@ class TextEntityFinder:
             key = (item['word'], item['entity_type'])
             if key not in unique:
                 unique[key] = item
-        self.found_words = list(unique.values())
+        self.found_words[:] = list(unique.values())
 
-    def _get_fake_var(self, entity_type):
+    def _get_fake_var(self, entity_type, faker=None):
         """Generate fake data based on the entity type using the Finnish locale."""
+        faker = faker or self.faker
         company_ends = ['Oyj', 'As Oy', 'Oy', 'ry', 'Ky', 'Osk', 'Tmi']
         if entity_type == "EMAIL_ADDRESS":
-            return self.faker.email().lower()
+            return faker.email().lower()
         elif entity_type == "LOCATION":
-            return self.faker.city().lower()
+            return faker.city().lower()
         elif entity_type == "PERSON":
-            return self.faker.name().lower()
+            return faker.name().lower()
         elif entity_type == "PHONE_NUMBER":
-            return self.faker.phone_number().lower()
+            return faker.phone_number().lower()
         elif entity_type == "URL":
-            return self.faker.url().lower()
+            return faker.url().lower()
         elif entity_type == "ORGANIZATION":
-            comp = self.faker.company()
+            comp = faker.company()
             try:
                 ending = comp.split(" ")[-1]
                 if ending in company_ends:
                     return comp
                 else:
-                    return f"{comp} {self.faker.company_suffix()}".lower()
+                    return f"{comp} {faker.company_suffix()}".lower()
             except Exception:
-                return f"{comp} {self.faker.company_suffix()}".lower()
+                return f"{comp} {faker.company_suffix()}".lower()
         else:
             return "Unknown_type"
 
@@ -158,11 +261,10 @@ class TextEntityFinder:
     def create_replacement(self, one):
         curr_type = one['entity_type']
         if curr_type in self.DEFAULT_ANONYM_ENTITIES:
-            fake_data = self.generate_fake_data(curr_type, one.get('word', None))
-            while fake_data in self.replacements:
-                fake_data = self.generate_fake_data(curr_type, one.get('word', None))
-            self.replacements.append(fake_data)
-            return fake_data
+            # Both mark the value used in self.replacements
+            if self.keyed_pseudonyms is not None:
+                return self.keyed_pseudonyms.take(one['word'], curr_type)
+            return self.pseudonym_pool.take(curr_type, one.get('word', None))
         else:
             print(Warning(f"WARNING! Unknown entity type {curr_type} in {one}!"))
             return "Unknown_type"
@@ -177,12 +279,12 @@ class TextEntityFinder:
                     rep_try = f"{TextEntityFinder.finnish_entity_mapping[curr_type]}_{self.entity_counters[curr_type] + ind}".lower()
                     ind += 1
                 self.entity_counters[curr_type] += 1
-                self.replacements.append(rep_try)
+                self.replacements.add(rep_try)
                 return rep_try
             else:
                 self.entity_counters[curr_type] = 1
                 rep = f"{TextEntityFinder.finnish_entity_mapping[curr_type]}_{self.entity_counters[curr_type]}".lower()
-                self.replacements.append(rep)
+                self.replacements.add(rep)
                 return rep
         else:
             print(Warning(f"WARNING! Unknown entity type {curr_type} in {one}!"))
@@ -190,135 +292,250 @@ class TextEntityFinder:
 
 
     def find_entities(self, text, faker_replacements=True, safe_approach=True, better_accu_more_fp=True, confidence_score:int=0.5):
-        comb_words = []
+        comb_words = self.cached_detections([text], better_accu_more_fp, confidence_score)[0]
+        if comb_words is None:
+            comb_words = self.detect_entities(text, better_accu_more_fp)
+            self.cache_detections([text], [comb_words], better_accu_more_fp, confidence_score)
+        new_words = self.register_entities(comb_words, faker_replacements, confidence_score)
+        if safe_approach:
+            self.journal.append(new_words)
+        return comb_words
+
+    def find_entities_batch(self, chunks, faker_replacements=True, safe_approach=True, better_accu_more_fp=True, confidence_score:int=0.5,
+                            batch_size=16):
+        """
+        Same as calling find_entities for each chunk, but the models run on batch_size chunks at a time.
+        Found words are registered in chunk order, so replacements are the same as with find_entities.
+        Returns list of found words for each chunk.
+        """
+        all_words = self._detect_with_cache(list(chunks), better_accu_more_fp, confidence_score, batch_size)
+        for comb_words in all_words:
+            new_words = self.register_entities(comb_words, faker_replacements, confidence_score)
+            if safe_approach:
+                self.journal.append(new_words)
+        if safe_approach:
+            self.journal.sync()
+        return all_words
+
+    def find_entities_in_chunks(self, text_chunks, faker_replacements=True, safe_approach=True, better_accu_more_fp=True,
+                                confidence_score:int=0.5, batch_size=16, detector=None):
+        """
+        find_entities for a stream of chunks. For TextChunks the found words get document offsets and
+        entities found twice in overlapping chunks are registered once. detector is anything with
+        iter_detections, this finder by default or a NERWorkerPool. Returns the number of chunks.
+        """
+        detector = detector or self
+        chunk_count = 0
+        detections = detector.iter_detections(text_chunks, better_accu_more_fp, confidence_score, batch_size)
+        for comb_words in merge_chunk_detections(detections):
+            new_words = self.register_entities(comb_words, faker_replacements, confidence_score)
+            if safe_approach:
+                self.journal.append(new_words)
+            chunk_count += 1
+        if safe_approach:
+            self.journal.sync()
+        return chunk_count
+
+    def iter_detections(self, text_chunks, better_accu_more_fp=True, confidence_score:int=0.5, batch_size=16):
+        """Yields (chunk, detected words) in chunk order, detected schedule_window chunks at a time."""
+        for window in iter_batches(text_chunks, max(batch_size, self.schedule_window)):
+            yield from zip(window, self._detect_with_cache(window, better_accu_more_fp, confidence_score, batch_size))
+
+    def _detect_with_cache(self, chunks, better_accu_more_fp, confidence_score, batch_size):
+        all_words = self.cached_detections(chunks, better_accu_more_fp, confidence_score)
+        missing = [ind for ind, words in enumerate(all_words) if words is None]
+        detected = self.detect_entities_batch([chunks[ind] for ind in missing], better_accu_more_fp, batch_size)
+        for ind, comb_words in zip(missing, detected):
+            all_words[ind] = comb_words
+        self.cache_detections([chunks[ind] for ind in missing], detected, better_accu_more_fp, confidence_score)
+        return all_words
+
+    def _ner_cache_keys(self, chunks, better_accu_more_fp, confidence_score):
+        version = self.entity_set_version()
+        return [NERResultCache.make_key(chunk, version, confidence_score, better_accu_more_fp) for chunk in chunks]
+
+    def cached_detections(self, chunks, better_accu_more_fp=True, confidence_score:int=0.5):
+        """Cached detections for each chunk, None for the chunks that have to go through the models."""
+        if self.ner_cache is None:
+            return [None] * len(chunks)
+        keys = self._ner_cache_keys(chunks, better_accu_more_fp, confidence_score)
+        found = self.ner_cache.get_many(keys)
+        # Every chunk gets its own words, offsets are moved and keys popped later for each chunk separately
+        return [copy.deepcopy(found[key]) if key in found else None for key in keys]
+
+    def cache_detections(self, chunks, all_words, better_accu_more_fp=True, confidence_score:int=0.5):
+        """Saves detections to the cache, call before register_entities changes them."""
+        if self.ner_cache is None or not chunks:
+            return
+        self.ner_cache.put_many(list(zip(self._ner_cache_keys(chunks, better_accu_more_fp, confidence_score), all_words)))
+
+    def detect_entities(self, text, better_accu_more_fp=True):
+        """Runs the detection for one chunk without touching found words."""
+        if self.detection_profile == "fast":
+            return self.detect_entities_fast([text])[0]
         # Combined method -analyzer
         temp_analyzer_results = self.comp_analyzer.analyze(text=text, entities=TextEntityFinder.DEFAULT_ANONYM_ENTITIES, allow_list=self.to_keep_list, language=self.lang)
-        # Restructuring anonymizer results
-        for obj in [entity.to_dict() for entity in temp_analyzer_results]:
-            entity = self.mapping_labels[obj['entity_type']] if obj['entity_type'] in self.mapping_labels else obj['entity_type']
-            one_word = text[obj['start']:obj['end']].strip()
-            comb_words.append({'UID': one_word + entity, 'word': one_word,'entity_type': entity,
-                               "ner_method": 'comp_method', 'score': obj['score']})
+        comb_words = self._analyzer_results_to_words(text, temp_analyzer_results, 'comp_method')
 
-        if better_accu_more_fp:
+        if better_accu_more_fp and self.detection_profile == "thorough":
             comb_words.extend(self.presidio_ner_method(text, only_allowed=['EMAIL_ADDRESS', 'PHONE_NUMBER']))
             # comb_words.extend(self.spacy_ner_method(text))
             # comb_words.extend(self.trans_based_ner_method(text))
+        return comb_words
 
+    def detect_entities_batch(self, chunks, better_accu_more_fp=True, batch_size=16):
+        """Batched detect_entities. Returns list of found words for each chunk."""
+        chunks = list(chunks)
+        if not chunks:
+            return []
+        if self.detection_profile == "fast":
+            return self.detect_entities_fast(chunks, batch_size)
+        # spaCy runs once per chunk with nlp.pipe, both analyzers use the same artifacts
+        nlp_engine = self.comp_analyzer.nlp_engine
+        artifacts = [nlp_artifacts for _, nlp_artifacts in nlp_engine.process_batch(chunks, language=self.lang, batch_size=batch_size)]
+        self.transformers_recognizer.predict_batch(chunks, batch_size=batch_size)
+        all_words = []
+        try:
+            for text, nlp_artifacts in zip(chunks, artifacts):
+                temp_analyzer_results = self.comp_analyzer.analyze(text=text, entities=TextEntityFinder.DEFAULT_ANONYM_ENTITIES, allow_list=self.to_keep_list,
+                                                                   language=self.lang, nlp_artifacts=nlp_artifacts)
+                comb_words = self._analyzer_results_to_words(text, temp_analyzer_results, 'comp_method')
+                if better_accu_more_fp and self.detection_profile == "thorough":
+                    result = self.trad_analyzer.analyze(text=text, language='fi', nlp_artifacts=nlp_artifacts)
+                    comb_words.extend(self._analyzer_results_to_words(text, result, 'presidio', only_allowed=['EMAIL_ADDRESS', 'PHONE_NUMBER']))
+                all_words.append(comb_words)
+        finally:
+            self.transformers_recognizer.clear_predictions()
+        return all_words
+
+    def might_contain_names(self, text):
+        return TextEntityFinder.name_candidate_pattern.search(text) is not None
+
+    def detect_entities_fast(self, chunks, batch_size=16):
+        """Detection of the fast profile. Returns list of found words for each chunk."""
+        candidates = [chunk for chunk in chunks if self.might_contain_names(chunk)]
+        self.transformers_recognizer.predict_batch(candidates, batch_size=batch_size)
+        all_words = []
+        try:
+            for text in chunks:
+                comb_words = []
+                for recognizer in self.regex_recognizers:
+                    result = recognizer.analyze(text, recognizer.supported_entities)
+                    comb_words.extend(self._analyzer_results_to_words(text, result, 'presidio'))
+                if self.might_contain_names(text):
+                    result = self.transformers_recognizer.analyze(text, TextEntityFinder.DEFAULT_ANONYM_ENTITIES)
+                    comb_words.extend(self._analyzer_results_to_words(text, result, 'transformer'))
+                all_words.append(comb_words)
+        finally:
+            self.transformers_recognizer.clear_predictions()
+        return all_words
+
+    def register_entities(self, comb_words, faker_replacements=True, confidence_score:int=0.5):
+        """Adds accepted words of one chunk to found words and creates their replacements. Returns the added words."""
+        new_words = []
         comb_words.sort(key=lambda x: len(x['word']), reverse=True)
         for one in comb_words:
+            # Offsets are only needed while merging chunks, found words are the same wherever they were found
+            one.pop('start', None)
+            one.pop('end', None)
             if one['entity_type'] in TextEntityFinder.to_censor_ents and one['word'] not in self.to_keep_list:
                 if one['score'] is None or one['score'] > confidence_score:  # Set confidence score to filter false-positives
                     if len(one['word']) > 3:  # To rule out short words
-                        if one['UID'] not in [sec['UID'] for sec in self.found_words]:
+                        if not self.found_words.has_uid(one['UID']):
                             one['replacement'] = self.create_replacement(one) if faker_replacements else self.legacy_create_replacement(one)
                             self.found_words.append(one)
-        if safe_approach:
-            self.export_raw_words_to_csv("safe_approach_file.csv")
-        return comb_words
+                            new_words.append(one)
+        return new_words
+
+    def _analyzer_results_to_words(self, text, results, ner_method, only_allowed:list=None):
+        # Restructuring anonymizer results
+        words = []
+        for obj in [entity.to_dict() for entity in results]:
+            if only_allowed and obj['entity_type'] not in only_allowed:
+                continue
+            entity = self.mapping_labels[obj['entity_type']] if obj['entity_type'] in self.mapping_labels else obj['entity_type']
+            words.append(self._make_word(text, obj['start'], obj['end'], entity, ner_method, obj['score']))
+        return words
+
+    @staticmethod
+    def _make_word(text, start, end, entity, ner_method, score):
+        one_word = text[start:end].strip()
+        start += len(text[start:end]) - len(text[start:end].lstrip())  # offsets of the stripped word
+        return {'UID': one_word + entity, 'word': one_word,'entity_type': entity, "ner_method": ner_method, 'score': score,
+                'start': start, 'end': start + len(one_word)}
 
     def spacy_pattern_method(self, text):
         pass  # for future
 
     def spacy_ner_method(self, text):
-        doc = self.spacy_nlp(text)
+        return self._spacy_doc_to_words(self.spacy_nlp(text, disable=self.spacy_disabled_pipes))
+
+    def spacy_ner_method_batch(self, texts, batch_size=16):
+        docs = self.spacy_nlp.pipe(texts, disable=self.spacy_disabled_pipes, batch_size=batch_size)
+        return [self._spacy_doc_to_words(doc) for doc in docs]
+
+    def _spacy_doc_to_words(self, doc):
         words = []
         for ent in doc.ents:
             to_use_label = self.mapping_labels[ent.label_] if ent.label_ in self.mapping_labels else ent.label_
-            words.append({'UID': ent.text.strip() + to_use_label, 'word': ent.text.strip(), 'entity_type': to_use_label,
-                          "ner_method": 'spacy', 'score': None})
+            words.append(self._make_word(doc.text, ent.start_char, ent.end_char, to_use_label, 'spacy', None))
         return words
 
     def presidio_ner_method(self, text, only_allowed:list=None):
         result = self.trad_analyzer.analyze(text=text, language='fi')
-        words = []
-
-        for obj in [entity.to_dict() for entity in result]:
-            if only_allowed:
-                if obj['entity_type'] in only_allowed:
-                    entity = self.mapping_labels[obj['entity_type']] if obj['entity_type'] in self.mapping_labels else obj['entity_type']
-                    one_word = text[obj['start']:obj['end']].strip()
-                    words.append({'UID': one_word + entity, 'word': one_word,'entity_type': entity,
-                                  "ner_method": 'presidio', 'score': obj['score']})
-            else:
-                entity = self.mapping_labels[obj['entity_type']] if obj['entity_type'] in self.mapping_labels else obj['entity_type']
-                one_word = text[obj['start']:obj['end']].strip()
-                words.append({'UID': one_word + entity, 'word': one_word, 'entity_type': entity,
-                              "ner_method": 'presidio', 'score': obj['score']})
-
-        return words
+        return self._analyzer_results_to_words(text, result, 'presidio', only_allowed)
 
     def trans_based_ner_method(self, text):  # makes no difference, thus no worth using with comp-method
         """NER Transformers PIPELINE"""
-        transformer_res = self.trans_nlp(text)
+        return self._transformer_results_to_words(text, self.trans_nlp(text))
+
+    def trans_based_ner_method_batch(self, texts, batch_size=16):
+        texts = list(texts)
+        if not texts:
+            return []
+        results = self.batch_scheduler.run(texts, self.trans_nlp)
+        return [self._transformer_results_to_words(text, result) for text, result in zip(texts, results)]
+
+    def _transformer_results_to_words(self, text, transformer_res):
         words = []
         for obj in transformer_res:
             entity = self.mapping_labels[obj['entity_group']] if obj['entity_group'] in self.mapping_labels else obj['entity_group']
-            one_word = text[obj['start']:obj['end']].strip()
-            words.append({'UID': one_word + entity, 'word': one_word,'entity_type': entity,
-                          "ner_method": 'transformer', 'score': obj['score']})
+            words.append(self._make_word(text, obj['start'], obj['end'], entity, 'transformer', obj['score']))
         return words
 
     @staticmethod
     def normalize_word(word):
         """Normalize a word by removing special characters and handling split words."""
-        normalized = re.sub(r'[\-\s]+', '', word)  # Remove hyphens and spaces
-        return normalized.lower()  # Convert to lowercase to standardize
+        return EntityClusterer.normalize_word(word)
 
-    def try_to_map_similar_entities(self, entities, similarity_threshold=75):
+    def try_to_map_similar_entities(self, entities, similarity_threshold=EntityClusterer.DEFAULT_THRESHOLD):
         """
-        Find and update entities with similar words based on fuzzy matching,
-        including similarity scores.
+        Find entities with similar words based on fuzzy matching, see EntityClusterer.
 
         Parameters:
         entities (list of dicts): The list of entities to process.
-        similarity_threshold (float): The threshold for considering words as similar (default 95).
+        similarity_threshold (float): The threshold for considering words as similar (default EntityClusterer.DEFAULT_THRESHOLD).
 
         Returns:
-        list of dicts: Updated list of entities with similar entities having the same replacement
-                       and including similarity score and similarity score with.
+        list of dicts: Copies of the entities where similar entities have the same replacement,
+                       including similarity score and similarity score with.
         """
-        # Normalize words for all entities
-        for index, entity in enumerate(entities):
-            entity['normalized_word'] = self.normalize_word(entity['word'])
-            if (index + 1) % 100 == 0:
-                print(f"{index + 1} entities checked")
-
-        # Map each unique normalized word to the best replacement found, including similarity score
-        word_to_info = {}
-        for index, entity in enumerate(entities):
-            word = entity['normalized_word']
-            # Use process.extract to find matches above the similarity threshold
-            matches = rf_process.extract(word, [e['normalized_word'] for e in entities if e['normalized_word'] != word],
-                                      scorer=fuzz.WRatio, score_cutoff=similarity_threshold, limit=1)
-
-            if matches:
-                best_match = matches[0]
-                matched_word = best_match[0]
-                similarity_score = best_match[1]
-                word_to_info[word] = {'replacement': entity['replacement'],
-                                      'similarity_score': similarity_score,
-                                      'similarity_score_with': matched_word}
-
-            if (index + 1) % 100 == 0:
-                print(f"{index + 1} unique words processed")
-
-        # Update entities with the best replacement and similarity info for similar words
-        for entity in entities:
-            normalized_word = entity['normalized_word']
-            if normalized_word in word_to_info:
-                entity['replacement'] = word_to_info[normalized_word]['replacement']
-                entity['similarity_score'] = word_to_info[normalized_word]['similarity_score']
-                entity['similarity_score_with'] = word_to_info[normalized_word]['similarity_score_with']
-            else:
-                # Ensure all entities have these fields for consistency
-                entity['similarity_score'] = None
-                entity['similarity_score_with'] = None
-            # del entity['normalized_word'] # don't delete while testing
-
-        print("Similarity matching process finished")
-        return entities
-
+        mapped = EntityClusterer(similarity_threshold=similarity_threshold).map_similar(entities)
+        print(f"Similarity matching process finished, {len(set(entity['cluster_id'] for entity in mapped))} groups "
+              f"from {len(mapped)} entities")
+        return mapped
+
+    def apply_similar_entity_mapping(self, mapped):
+        """Gives the found entities the shared replacements from try_to_map_similar_entities. Returns the number changed."""
+        changed = 0
+        for entity in mapped:
+            found = self.found_words.get_by_uid(entity['UID'])
+            if found is not None and found.get('replacement') != entity['replacement']:
+                found['replacement'] = entity['replacement']
+                changed += 1
+        if changed:
+            self.found_words.touch()
+        return changed
 
     def export_entities_to_csv(self, filename='entities.csv', test_ents=None):
         if not filename.endswith(".csv"):
@@ -351,7 +568,7 @@ class TextEntityFinder:
             print("No entities to print.")
             return
         try:
-            df = pd.DataFrame(self.found_words)
+            df = pd.DataFrame(ents)
             df.to_csv(filename, sep=',', index=False, encoding='utf-8')
             if 'safe' not in filename:
                 print(f"Entities exported to {filename}. Please modify this file and then import it back.")
@@ -364,37 +581,60 @@ class TextEntityFinder:
             return False
         try:
             if replace:
-                self.memory.found_entities = []
-                self.found_words = self.memory.found_entities
+                self.found_words.clear()  # same object as memory.found_entities, so the anonymizer sees the change
             with open(filename, newline='', encoding='utf-8') as file:
                 dict_reader = csv.DictReader(file)
                 for row in dict_reader:
-                    # Check if UID is not found in any of the dictionaries within self.found_words
-                    try:
-                        if not any(sec.get('UID') == row['UID'] for sec in self.found_words):
-                            # Update entity_counters
-                            entity_type = row['entity_type']
-                            if entity_type in self.entity_counters:
-                                self.entity_counters[entity_type] += 1
-                            else:
-                                self.entity_counters[entity_type] = 1
-                            self.replacements.append(row['replacement'])
-                            self.found_words.append(row)  # Append the whole dictionary
-                    except KeyError:
-                        if not any(sec.get('UID') == row['UID'] for sec in self.found_words):
-                            # Update entity_counters
-                            entity_type = row['entity_type']
-                            if entity_type in self.entity_counters:
-                                self.entity_counters[entity_type] += 1
-                            else:
-                                self.entity_counters[entity_type] = 1
-                            self.replacements.append(row['replacement'])
-                            self.found_words.append(row)  # Append the whole dictionary
+                    self._add_known_entity(row)
             print("\nEntities imported successfully.")
             return True
         except Exception as e:
             print(f"\nEntities couldn't be imported due to this error: {e}")
 
+    def _add_known_entity(self, row):
+        """Adds an entity that already has a replacement. Returns False if its UID is found already."""
+        # Files exported with export_entities_to_csv have no UID column, it is built like in find_entities
+        if not row.get('UID'):
+            row['UID'] = row['word'] + row['entity_type']
+        # Check if UID is not found in self.found_words
+        if self.found_words.has_uid(row['UID']):
+            return False
+        # Update entity_counters
+        entity_type = row['entity_type']
+        if entity_type in self.entity_counters:
+            self.entity_counters[entity_type] += 1
+        else:
+            self.entity_counters[entity_type] = 1
+        self.replacements.add(row['replacement'])
+        self.found_words.append(row)  # Append the whole dictionary
+        return True
+
+    def add_known_entities(self, entities):
+        """Adds entities with their replacements, e.g. the ones kept in the file manifest. Returns the number added."""
+        added = 0
+        for entity in entities:
+            if entity['word'] not in self.to_keep_list and self._add_known_entity(dict(entity)):
+                added += 1
+        return added
+
+    def recover_from_journal(self):
+        """Adds the entities found in an interrupted run from the journal and compacts it. Returns the number added."""
+        added = 0
+        for entity in self.journal.replay():
+            if self._add_known_entity(entity):
+                added += 1
+        kept = self.journal.compact()
+        print(f"\n{added} entities recovered, the journal has {kept} entities.")
+        return added
+
+    def start_journal(self):
+        """Starts the journal of a new run with the entities found so far, entries of earlier runs are dropped."""
+        self.journal.reset(self.found_words)
+
+    def finish_journal(self):
+        """Deletes the journal once a run has finished, the entities are in memory and can be exported."""
+        self.journal.discard()
+
 
     def display_found_entities(self):
         print("\nFound entities are:")
@@ -404,17 +644,20 @@ class TextEntityFinder:
             for i, word_info in enumerate(self.found_words, start=1):
                 print(f"{i}. {word_info['word']} ({word_info['entity_type']}) - Replacement: {word_info.get('replacement', 'N/A')} (Method: {word_info.get('ner_method', 'N/A')})")
 
-    def anonymize_text(self, text):
-        anonymizated_text = text
-        key_dict = {}  # {actual:replacement}
-
-        for one in self.found_words:
-            subs, repl = one['word'], one['replacement']
-            # Check if the word is already processed
-            if subs in key_dict:
-                continue
-            # Perform a case-sensitive replacement without compiling a regex for each word
-            anonymizated_text = anonymizated_text.replace(subs, repl)
-            key_dict[subs] = repl
+    def replacement_engine(self):
+        """Automaton of the found entity words, built again only when the entities have changed."""
+        engine_key = (id(self.found_words), self.found_words.version)
+        if self._engine_key != engine_key:
+            self._engine = ReplacementEngine.from_entities(self.found_words)
+            self._engine_key = engine_key
+        return self._engine
+
+    def anonymize_text(self, text, return_matches=False):
+        # Case-sensitive, leftmost-longest replacement of all found words in a single pass
+        engine = self.replacement_engine()
+        anonymizated_text, matches = engine.replace(text)
+        key_dict = {word: engine.replacements[word] for _, _, word in matches}  # {actual:replacement} of the words in text
+        if return_matches:
+            return anonymizated_text, key_dict, matches  # matches are [(start, end, word)] in the original text
         return anonymizated_text, key_dict
 
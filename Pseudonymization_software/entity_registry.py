@@ -0,0 +1,99 @@
+class EntityRegistry(list):
+    """
+    List of found entity dicts ({'UID', 'word', 'entity_type', 'ner_method', 'score', 'replacement'})
+    with indexes by UID and by word, so membership checks and replacement lookups don't scan the
+    whole list. It is still a list, so code that iterates, exports or builds DataFrames from the
+    entities works as before.
+
+    The indexes point to the first entity in list order with the UID or word, like a linear scan
+    would. Change the list through its methods (or slice assignment) so the indexes stay valid.
+    The version counter grows on every change, cached data built from the entities can use it to
+    notice that they changed.
+    """
+
+    def __init__(self, entities=()):
+        super().__init__()
+        self._by_uid = {}
+        self._by_word = {}
+        self.version = 0
+        self.extend(entities)
+
+    @staticmethod
+    def uid_of(entity):
+        return entity['UID'] if entity.get('UID') else entity['word'] + entity['entity_type']
+
+    def _index(self, entity):
+        self._by_uid.setdefault(self.uid_of(entity), entity)
+        self._by_word.setdefault(entity['word'], entity)
+
+    def _reindex(self):
+        self._by_uid = {}
+        self._by_word = {}
+        for entity in self:
+            self._index(entity)
+        self.version += 1
+
+    def has_uid(self, uid):
+        return uid in self._by_uid
+
+    def get_by_uid(self, uid, default=None):
+        return self._by_uid.get(uid, default)
+
+    def get_by_word(self, word, default=None):
+        return self._by_word.get(word, default)
+
+    def __reduce__(self):
+        # Indexes are rebuilt from the entities, list pickling would append before __init__ has run
+        return self.__class__, (list(self),)
+
+    def touch(self):
+        """Call after changing entities in place, e.g. their replacements."""
+        self.version += 1
+
+    def append(self, entity):
+        super().append(entity)
+        self._index(entity)
+        self.version += 1
+
+    def extend(self, entities):
+        for entity in entities:
+            self.append(entity)
+
+    def __iadd__(self, entities):
+        self.extend(entities)
+        return self
+
+    # Changes that can move or drop indexed entities rebuild the indexes
+
+    def insert(self, index, entity):
+        super().insert(index, entity)
+        self._reindex()
+
+    def remove(self, entity):
+        super().remove(entity)
+        self._reindex()
+
+    def pop(self, index=-1):
+        entity = super().pop(index)
+        self._reindex()
+        return entity
+
+    def clear(self):
+        super().clear()
+        self._reindex()
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self._reindex()
+
+    def reverse(self):
+        super().reverse()
+        self._reindex()
+
+    def __setitem__(self, index, value):
+        super().__setitem__(index, value)
+        self._reindex()
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self._reindex()
@@ -0,0 +1,102 @@
+import hashlib
+import os
+import pickle
+import time
+import zlib
+
+
+def file_content_hash(file_path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """
+    Persistent cache for reader output, keyed by file content hash and extractor version.
+
+    Entries are zlib-compressed pickles, one file per key, so parallel readers can share the
+    cache directory. Reading an entry refreshes its mtime, which is used for age and size eviction.
+    The size of the entries is tracked while writing, and once it passes max_size_mb the least
+    recently used entries are evicted down to 90% of it, so the limit holds during long runs too.
+    """
+    FILE_SUFFIX = ".bin"
+
+    def __init__(self, cache_dir="extraction_cache", extractor_version=1, max_size_mb=1024, max_age_days=30):
+        self.cache_dir = cache_dir
+        self.extractor_version = extractor_version
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.max_age_seconds = max_age_days * 24 * 60 * 60
+        self.total_size = 0  # bytes of the entries, counted by evict() and kept up by put()
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        self.evict()
+
+    def _entry_path(self, content_hash):
+        return os.path.join(self.cache_dir, f"{content_hash}_v{self.extractor_version}{self.FILE_SUFFIX}")
+
+    def get(self, content_hash):
+        entry_path = self._entry_path(content_hash)
+        try:
+            with open(entry_path, 'rb') as file:
+                data = pickle.loads(zlib.decompress(file.read()))
+            os.utime(entry_path)
+            return data
+        except FileNotFoundError:
+            return None
+        except Exception as err:
+            print(Warning(f"ExtractionCache: Dropping unreadable cache entry {entry_path}: {err}"))
+            self._remove(entry_path)
+            return None
+
+    def put(self, content_hash, data):
+        entry_path = self._entry_path(content_hash)
+        # Write to a temp file and rename, so a reader never sees a half-written entry
+        temp_path = f"{entry_path}.{os.getpid()}.tmp"
+        try:
+            payload = zlib.compress(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+            with open(temp_path, 'wb') as file:
+                file.write(payload)
+            replaced_size = os.path.getsize(entry_path) if os.path.exists(entry_path) else 0
+            os.replace(temp_path, entry_path)
+        except Exception as err:
+            print(Warning(f"ExtractionCache: Couldn't store cache entry {entry_path}: {err}"))
+            self._remove(temp_path)
+            return
+        self.total_size += len(payload) - replaced_size
+        if self.total_size > self.max_size_bytes:
+            # Trimmed below the limit, so the next few puts don't scan the directory again
+            self.evict(target_bytes=int(self.max_size_bytes * 0.9))
+
+    def evict(self, target_bytes=None):
+        """Removes entries older than max age and then least recently used entries until under target_bytes, max size by default."""
+        target_bytes = self.max_size_bytes if target_bytes is None else target_bytes
+        entries = []
+        now = time.time()
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith(self.FILE_SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.max_age_seconds:
+                self._remove(entry.path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= target_bytes:
+                break
+            self._remove(path)
+            total_size -= size
+        self.total_size = total_size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,62 @@
+import hashlib
+import hmac
+import os
+
+from faker import Faker
+
+
+class KeyedPseudonymGenerator:
+    """
+    Replacements derived from the entity itself instead of the order entities are found in. The
+    HMAC-SHA256 of the project secret over the entity type and normalized word seeds the Faker
+    draw, so every process, run and machine with the same secret gives an entity the same
+    replacement without sharing any state. The secret keeps the replacements from being linked
+    back to the words by hashing guessed names.
+
+    If the value is already used by another entity, the next probe number is hashed in, so a
+    collision is resolved the same way everywhere the same entities are met.
+    """
+    SECRET_ENV = "PSEUDO_PROJECT_SECRET"
+    MAX_PROBES = 50
+
+    def __init__(self, make_value, secret=None, used=None):
+        """make_value(faker, entity_type) returns one value. secret defaults to the PSEUDO_PROJECT_SECRET environment variable."""
+        secret = secret if secret is not None else os.environ.get(self.SECRET_ENV)
+        if not secret:
+            raise ValueError(f"KeyedPseudonymGenerator: Project secret missing, set {self.SECRET_ENV} environment variable.")
+        self.secret = secret.encode('utf-8') if isinstance(secret, str) else secret
+        self.make_value = make_value
+        self.used = used if used is not None else set()
+        self.faker = Faker('fi_FI')
+        self._owners = {}  # {value: (normalized word, entity_type)} of the values given here
+
+    @staticmethod
+    def normalize(word):
+        return " ".join(word.split()).lower()
+
+    def _digest(self, normalized, entity_type, probe):
+        message = "\x1f".join([entity_type, normalized, str(probe)]).encode('utf-8')
+        return hmac.new(self.secret, message, hashlib.sha256).digest()
+
+    def derive(self, word, entity_type, probe=0):
+        """Value for the entity on the given probe, the same on every call."""
+        self.faker.seed_instance(int.from_bytes(self._digest(self.normalize(word), entity_type, probe)[:8], 'big'))
+        return self.make_value(self.faker, entity_type)
+
+    def take(self, word, entity_type):
+        """Returns the replacement of the entity and marks it used."""
+        owner = (self.normalize(word), entity_type)
+        original = "^" + word.lower()
+        for probe in range(self.MAX_PROBES):
+            value = self.derive(word, entity_type, probe)
+            if self._owners.get(value) == owner:
+                return value  # same entity written differently, e.g. in other case
+            if value not in self.used and value != original:
+                self._owners[value] = owner
+                self.used.add(value)
+                return value
+        # Small value spaces can run out, the digest keeps the value unique and deterministic
+        value = f"{self.derive(word, entity_type)} {self._digest(owner[0], entity_type, 'suffix').hex()[:6]}"
+        self._owners[value] = owner
+        self.used.add(value)
+        return value
@@ -0,0 +1,77 @@
+import math
+import re
+
+
+class RepeatedLayoutDetector:
+    """
+    Finds the text repeated on the pages of one document, like letterheads, project names, page
+    footers and contact blocks, from the span positions and texts of a SpanStore. Only spans inside
+    the top and bottom margin_ratio of the page height are checked, body text is never taken out
+    of its paragraph. A span is fingerprinted by its position (x0, x1 and y0, rounded to
+    position_tolerance points) and its text with whitespace collapsed and digits replaced, so
+    "Sivu 3 / 12" and "Sivu 4 / 12" match. A fingerprint found on at least min_page_ratio of the
+    pages, and on two pages at least, is repeated. Documents with fewer than min_pages pages are
+    not checked.
+
+    NER needs to see each repeated text only once per document. Texts differing only by digits are
+    all kept, as the digits may be a phone number. Found words are replaced in every span when the
+    files are rewritten, so the other occurrences are pseudonymized as well.
+    """
+    DIGITS = re.compile(r"\d+")
+
+    def __init__(self, min_pages=3, min_page_ratio=0.5, position_tolerance=2.0, margin_ratio=0.1):
+        self.min_pages = min_pages
+        self.min_page_ratio = min_page_ratio
+        self.position_tolerance = position_tolerance
+        self.margin_ratio = margin_ratio
+
+    def fingerprint(self, text, x0, x1, y0):
+        position = tuple(round(value / self.position_tolerance) for value in (x0, x1, y0))
+        return position, self.DIGITS.sub("#", " ".join(text.split()))
+
+    def in_margin(self, y0, y1, page_height):
+        margin = page_height * self.margin_ratio
+        return y1 <= margin or y0 >= page_height - margin
+
+    def find(self, store):
+        """
+        Returns (indexes of the repeated spans, indexes of the first occurrence of each distinct repeated text),
+        both as sets of span indexes of the store.
+        """
+        page_count = len(store.pages)
+        if page_count < self.min_pages:
+            return set(), set()
+        spans = {}  # {fingerprint: [span index]}
+        for page_pos in range(page_count):
+            page_height = store.pages[page_pos]['size'][1]
+            start, end = store.page_span_range(page_pos)
+            for ind, text in enumerate(store.iter_texts(start, end), start=start):
+                if text.strip() and self.in_margin(store.y0[ind], store.y1[ind], page_height):
+                    spans.setdefault(self.fingerprint(text, store.x0[ind], store.x1[ind], store.y0[ind]), []).append(ind)
+
+        required = max(2, math.ceil(self.min_page_ratio * page_count))
+        repeated, first_occurrences = set(), set()
+        for indexes in spans.values():
+            if len({store.page_index[ind] for ind in indexes}) >= required:
+                repeated.update(indexes)
+                first_occurrences.update({store.get_text(ind).strip(): ind for ind in reversed(indexes)}.values())
+        return repeated, first_occurrences
+
+    def split_texts(self, store):
+        """
+        Returns (span texts with the repeated ones emptied, texts of the first occurrences) for chunking.
+        An emptied span ends a chunk, and first occurrences of adjacent spans stay together.
+        """
+        repeated, first_occurrences = self.find(store)
+        if not repeated:
+            return list(store.iter_texts()), []
+        body_texts, repeated_texts = [], []
+        previous = None
+        for ind, text in enumerate(store.iter_texts()):
+            body_texts.append("" if ind in repeated else text)
+            if ind in first_occurrences:
+                if previous is not None and previous != ind - 1:
+                    repeated_texts.append("")
+                repeated_texts.append(text)
+                previous = ind
+        return body_texts, repeated_texts
@@ -2,11 +2,22 @@ import os
 import csv
 import json
 import warnings
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 from memory import RunTimeMemory
 from pdf_anonymizer import PDFAnonymizer
-from readers import FileReader, DirReader
+from readers import FileReader, DirReader, extract_file_in_worker
+from extraction_cache import ExtractionCache
+from manifest import FileManifest
+from ocr import OCRProcessor
 from entity_recognizer import TextEntityFinder
+from ner_pool import NERWorkerPool
+from ner_cache import NERResultCache
+from chunker import TokenAwareChunker, iter_text_chunks, construct_text_chunks
+from layout_repeats import RepeatedLayoutDetector
+from entity_clustering import EntityClusterer
 
 
 class SimpleFileWriter:
@@ -66,59 +77,174 @@ class SimpleFileWriter:
 
 
 class PseudoProcess:
+    """
+    Reads files, finds entities and pseudonymizes the files. ingest_workers > 1 reads whole files
+    in a process pool, stream_pages=True finds entities while the pages of a file are read in this
+    process. The two can't be combined: with ingest_workers > 1, stream_pages is ignored with a warning.
+    """
 
-    def __init__(self, max_depth_for_dir=11, find_ents=True, pseudonym_ents=True):
+    def __init__(self, max_depth_for_dir=11, find_ents=True, pseudonym_ents=True, ingest_workers=1, extraction_cache_dir=None,
+                 stream_pages=False, manifest_path=None, walk_workers=1, ocr_backend=None, ocr_workers=None,
+                 max_resident_documents=None, ner_batch_size=16,
+                 inference_backend="pytorch", ner_workers=1, threads_per_ner_worker=1, ner_cache_path=None,
+                 ner_cache_max_entries=100000, chunking="paragraph", chunk_overlap_tokens=32,
+                 pseudonym_seed=None, replacement_mode="pool", project_secret=None, detection_profile="thorough",
+                 max_batch_tokens=4096, schedule_window=256, skip_repeated_layout=True):
         self.memory = RunTimeMemory()
-        self.file_reader = FileReader(memory=self.memory)
-        self.entity_finder = TextEntityFinder(memory=self.memory)
+        if max_resident_documents:
+            # Large runs keep only a working set of documents in memory, the rest is spilled to disk
+            self.memory.use_document_store(max_resident=max_resident_documents)
+        # Cache is opt-in, as it keeps the extracted plain text of the documents on disk
+        self.extraction_cache = ExtractionCache(cache_dir=extraction_cache_dir, extractor_version=FileReader.EXTRACTOR_VERSION) if extraction_cache_dir else None
+        self.file_reader = FileReader(memory=self.memory, cache=self.extraction_cache)
+        # Cache is opt-in, as it keeps the detected words on disk
+        self.ner_cache = NERResultCache(ner_cache_path, max_entries=ner_cache_max_entries) if ner_cache_path else None
+        self.entity_finder = TextEntityFinder(memory=self.memory, inference_backend=inference_backend, ner_cache=self.ner_cache,
+                                              pseudonym_seed=pseudonym_seed, replacement_mode=replacement_mode,
+                                              project_secret=project_secret, detection_profile=detection_profile,
+                                              max_batch_tokens=max_batch_tokens, schedule_window=schedule_window)
         self.pdf_anonymizer = PDFAnonymizer(memory=self.memory)
         self.max_depth = max_depth_for_dir
         self.find_entities = find_ents
         self.pseudonymize_entities = pseudonym_ents
-
+        self.ingest_workers = ingest_workers  # >1 reads files in a process pool
+        self.stream_pages = stream_pages  # NER consumes chunks while pages are still being read
+        if stream_pages and ingest_workers > 1:
+            warnings.warn("PseudoProcess: stream_pages is ignored with ingest_workers > 1, files are read whole in the worker processes.")
+        self.manifest = FileManifest(manifest_path) if manifest_path else None  # skips unchanged files on rescans
+        self.walk_workers = walk_workers  # >1 lists top-level subfolders in threads
+        # Files without a text layer are OCR'd after reading when a backend is given
+        self.ocr_processor = OCRProcessor(memory=self.memory, backend=ocr_backend, workers=ocr_workers) if ocr_backend else None
+        self.ner_batch_size = ner_batch_size  # spaCy batch size, transformer batches are formed by the batch scheduler
+        # >1 finds entities in forked worker processes that share the models loaded here
+        self.ner_pool = NERWorkerPool(self.entity_finder, workers=ner_workers, threads_per_worker=threads_per_ner_worker,
+                                      batch_size=ner_batch_size) if ner_workers > 1 else None
+        # "paragraph" gives the blank line separated chunks to NER as they are, "tokens" packs them up to the model's token limit
+        if chunking == "tokens":
+            self.chunker = TokenAwareChunker(self.entity_finder.tokenizer, overlap_tokens=chunk_overlap_tokens)
+        elif chunking == "paragraph":
+            self.chunker = None
+        else:
+            raise ValueError(f"PseudoProcess: Unknown chunking {chunking}, use 'paragraph' or 'tokens'.")
+        # Headers, footers and other text repeated on the pages of a document go to NER once per document
+        self.layout_repeats = RepeatedLayoutDetector() if skip_repeated_layout else None
 
     def reset_memory(self):
         self.memory.clear_memory()
+        self.entity_finder.finish_journal()  # the journal would bring the cleared entities back
 
     def _construct_temp_text_chunks(self, path):
-        one_data = self.memory.file_data[path]
-        #text_chunks = ["".join(item['text'] for content in page['content'] for item in [content] if item['type'] == 'text') for page in one_data]
-        text_chunks = []
-        text = "\n".join([item['text'].strip() for page in one_data for item in page['content'] if item['type'] == 'text'])
-        text_chunks = [row for row in text.split("\n\n") if len(row) > 1]
-        return text_chunks
+        return construct_text_chunks(self.memory.file_data[path], self.layout_repeats)
 
     def find_entities_in_memory(self, text_chunks):
-        if not text_chunks:
+        if self.chunker is not None:
+            text_chunks = self.chunker.chunk_stream(text_chunks)
+        chunk_count = self.entity_finder.find_entities_in_chunks(text_chunks, batch_size=self.ner_batch_size, detector=self.ner_pool)
+        if chunk_count == 0:
             raise Exception("Error: No data available for finding entities.")
-        for chunk in text_chunks:
-            self.entity_finder.find_entities(text=chunk)
+
+    def _stream_file_and_find_entities(self, path):
+        pages = self.file_reader.stream_file(path)
+        span_texts = (item['text'] for page in pages for item in page['content'] if item['type'] == 'text')
+        text_chunks = iter_text_chunks(span_texts)
+        first_chunk = next(text_chunks, None)
+        if first_chunk is None and (path in self.memory.needs_ocr or path in self.memory.duplicate_files):
+            return path in self.memory.file_data
+        self.find_entities_in_memory(itertools.chain([first_chunk], text_chunks) if first_chunk is not None else [])
+        return True
 
     def finding_process(self, read_from_path, read_only=False):
         if read_from_path.startswith('"') or read_from_path.endswith('"'):
             read_from_path = read_from_path.strip('"')
         try:
+            # Manifest is used only when NER runs, reading for pseudonymization needs every file
+            use_manifest = self.manifest is not None and not read_only
+            entity_set_version = self.entity_finder.entity_set_version() if use_manifest else None
+            if use_manifest:
+                # Skipped files are not searched again, their entities come from the manifest
+                loaded = self.entity_finder.add_known_entities(self.manifest.entities)
+                if loaded:
+                    print(f"{loaded} entities of earlier runs loaded from the manifest.")
             if self.is_path_single_file(read_from_path):
                 files_list = [read_from_path]
+                if use_manifest:
+                    files_list = self.manifest.filter_changed(files_list, entity_set_version)
+            elif use_manifest:
+                files_list = DirReader().get_changed_files_from_dir(path=read_from_path, max_depth=self.max_depth, manifest=self.manifest,
+                                                                    entity_set_version=entity_set_version,
+                                                                    allowed_types=self.file_reader.get_allowed_file_types(),
+                                                                    workers=self.walk_workers)
             else:
-                files_list = DirReader().get_all_files_from_dir(path=read_from_path, max_depth=self.max_depth)
+                files_list = list(DirReader().iter_files(path=read_from_path, max_depth=self.max_depth,
+                                                         allowed_types=self.file_reader.get_allowed_file_types(),
+                                                         workers=self.walk_workers))
+            if use_manifest:
+                print(f"{len(files_list)} new or changed files to handle.")
             self.memory.file_paths = files_list
+            if not read_only:
+                # The journal holds only this run, recovering an earlier one is offered before starting
+                self.entity_finder.start_journal()
+            parallel_reads = self._iter_parallel_reads(files_list) if self.ingest_workers > 1 else None
             for ind, path in enumerate(self.memory.file_paths):
                 try:
-                    if not self.file_reader.process_file(path):
+                    streamed = self.stream_pages and not read_only and parallel_reads is None
+                    if streamed:
+                        is_read = self._stream_file_and_find_entities(path)
+                    elif parallel_reads is not None:
+                        # results arrive in submission order, so needs_ocr and errors keep the file order
+                        content_hash, data = next(parallel_reads).result()
+                        is_read = self.file_reader.store_file_data(path, data, content_hash)
+                    else:
+                        is_read = self.file_reader.process_file(path)
+                    if not is_read:
                         print(f"file in {path} needs ocr handling")
                         continue
-                    if not read_only:
+                    if not read_only and not streamed and path not in self.memory.duplicate_files:
                         text_chunks = self._construct_temp_text_chunks(path=path)
                         self.find_entities_in_memory(text_chunks)
+                    if use_manifest:
+                        self.manifest.record(path, entity_set_version)
                 except Exception as err:
                     warnings.warn(str(err))
                     self.memory.log_file_errors[path] = str(err)
                 finally:
                     print(f"{ind+1}. file handled from total of {len(self.memory.file_paths)} files.")
+            if self.ocr_processor is not None and self.memory.needs_ocr:
+                print(f"Starting OCR for {len(self.memory.needs_ocr)} files.")
+                for path in self.ocr_processor.process_queue():
+                    try:
+                        if not read_only and path not in self.memory.duplicate_files:
+                            self.find_entities_in_memory(self._construct_temp_text_chunks(path=path))
+                        if use_manifest:
+                            self.manifest.record(path, entity_set_version)
+                    except Exception as err:
+                        warnings.warn(str(err))
+                        self.memory.log_file_errors[path] = str(err)
+            if use_manifest:
+                self.manifest.set_entities(self.memory.found_entities)
+                self.manifest.save()
+            if self.ner_cache is not None and not read_only:
+                print(f"NER cache: {self.ner_cache.hits} chunks found from cache, {self.ner_cache.misses} detected.")
+            # Batches run in NER worker processes are counted there
+            if not read_only and self.entity_finder.batch_scheduler.batches:
+                print(f"Transformer batches: {self.entity_finder.batch_scheduler.summary()}")
+            if not read_only:
+                self.entity_finder.finish_journal()
         except Exception as err:
             raise Exception(f"PseudoProcess - finding entities error: {err}")
 
+    def _iter_parallel_reads(self, paths):
+        # Keeps a bounded number of files in flight so NER in this process can consume them as they finish
+        window = self.ingest_workers * 4
+        with ProcessPoolExecutor(max_workers=self.ingest_workers) as executor:
+            futures = deque()
+            for path in paths:
+                futures.append(executor.submit(extract_file_in_worker, path, self.extraction_cache))
+                if len(futures) >= window:
+                    yield futures.popleft()
+            while futures:
+                yield futures.popleft()
+
     def is_path_single_file(self, read_from_path):
         if os.path.isfile(read_from_path):
             return True
@@ -159,6 +285,7 @@ def display_menu():
     print("2. Pseudonymize files")
     print("3. Review, export, and import entities")
     print("4. Read and pseudonymize files")
+    print("5. Give similar entities the same replacement")
     #print("5. See, add, update to_keep-/false_pos-list")
     #print("6. Anonymize texts")
     #print("7. Visualize anonymized files")
@@ -173,20 +300,28 @@ def display_menu():
     print()
     return choice
 
+def choose_detection_profile():
+    print("Choose how entities are found:")
+    print("1. Fast: e-mails, phone numbers and the transformer model only on text that may contain names")
+    print("2. Balanced: spaCy, transformer model and regexes in one pass")
+    print("3. Thorough: balanced and a second pass for e-mails and phone numbers (default)")
+    choice = input("1, 2 or 3: ").strip()
+    return {"1": "fast", "2": "balanced"}.get(choice, "thorough")
+
 def main():
     print("WELCOME!")
     print("Let's start testing!")
     first_time = True
     process = ""
+    # Speed vs accuracy of finding entities, used when the process is initialized
+    detection_profile = choose_detection_profile()
     while True:
         choice = display_menu()
 
-        # TODO: choose whatever to prioritize speed or accuracy
-
         if choice == "0":
             if first_time:
                 print("Initializing...\n")
-                process = PseudoProcess()
+                process = PseudoProcess(detection_profile=detection_profile)
                 first_time = False
             else:
                 process.reset_memory()
@@ -195,11 +330,15 @@ def main():
         elif choice == "1":
             if first_time:
                 print("Initializing...\n")
-                process = PseudoProcess()
+                process = PseudoProcess(detection_profile=detection_profile)
                 first_time = False
             read_only = False
             if input("Do you want to read files only? y if yes, anything else if no. Ans: ").lower() == "y":
                 read_only = True
+            if not read_only and process.entity_finder.journal.has_entries():
+                if input("Entities of an interrupted run were found. Recover them before starting? y if yes, "
+                         "anything else deletes them. Ans: ").lower() == "y":
+                    process.entity_finder.recover_from_journal()
             file_path = input("Enter the file or folder path: ")
             process.finding_process(file_path, read_only=read_only)
             print("Process ready")
@@ -227,7 +366,8 @@ def main():
                         \nPlease choose an action for entities:
                         1. Export entities to CSV for you to modify them
                         2. Import entities from CSV to use corrected ones 
-                        3. Done
+                        3. Recover entities found before an interrupted run
+                        4. Done
                         Your choice: """
 
             while True:
@@ -245,6 +385,12 @@ def main():
                         # Optionally validate the imported entities here
                         pass
                 elif choice == '3':
+                    if first_time:
+                        print("Initializing...\n")
+                        process = PseudoProcess(detection_profile=detection_profile)
+                        first_time = False
+                    process.entity_finder.recover_from_journal()
+                elif choice == '4':
                     break
                 else:
                     print("Invalid choice. Please try again.")
@@ -276,6 +422,19 @@ def main():
             process.pseudonym_process(save_path=folder_path)
             print("Process ready")
 
+        elif choice == '5':
+            if first_time or not process.ready_to_read_and_pseudo():
+                print("No entities in memory. Find or import them first.")
+                continue
+            threshold = input(f"Give similarity threshold 0-100 (default: {EntityClusterer.DEFAULT_THRESHOLD}): ").strip()
+            threshold = float(threshold) if threshold.replace(".", "", 1).isdigit() else EntityClusterer.DEFAULT_THRESHOLD
+            mapped = process.entity_finder.try_to_map_similar_entities(list(process.memory.found_entities), similarity_threshold=threshold)
+            filename = input("Enter filename for the results (default: similar_entities.csv): ").strip() or 'similar_entities.csv'
+            process.entity_finder.export_raw_words_to_csv(filename, test_ents=mapped)
+            if input("Use the shared replacements for the found entities? y if yes, anything else if no. Ans: ").lower() == "y":
+                changed = process.entity_finder.apply_similar_entity_mapping(mapped)
+                print(f"Replacement changed for {changed} entities.")
+
         elif choice == '99':
             # Stop the process
             print("Process stopped.")
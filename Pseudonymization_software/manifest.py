@@ -0,0 +1,79 @@
+import json
+import os
+
+from extraction_cache import file_content_hash
+
+
+class FileManifest:
+    """
+    Persisted record of processed files for incremental rescans.
+
+    Entries are {path: {'size', 'mtime', 'hash', 'entity_set_version'}}. A file is unchanged when
+    its size and mtime match, or when only the mtime differs but the content hash still matches.
+    Files processed with another entity set version (detection setup) count as changed.
+
+    Skipped files are not searched again, so the manifest also keeps the found entities with their
+    replacements, and they are loaded before a rescan. The manifest therefore holds detected words,
+    keep it as protected as exported entity lists. Older manifests without entities are ignored.
+    """
+
+    def __init__(self, manifest_path="file_manifest.json"):
+        self.manifest_path = manifest_path
+        self.entries = {}
+        self.entities = []  # found entities of the recorded files, [{'UID', 'word', 'entity_type', 'replacement', ...}]
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.manifest_path):
+            return
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except Exception as err:
+            print(Warning(f"FileManifest: Couldn't read {self.manifest_path}, all files are handled as new: {err}"))
+            return
+        if not isinstance(data, dict) or set(data) != {'files', 'entities'}:
+            print(Warning(f"FileManifest: {self.manifest_path} has no stored entities, all files are handled as new."))
+            return
+        self.entries = data['files']
+        self.entities = data['entities']
+
+    def save(self):
+        temp_path = self.manifest_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            # Transformer scores are numpy floats, they are stored as plain floats
+            json.dump({'files': self.entries, 'entities': self.entities}, file, ensure_ascii=False, default=float)
+        os.replace(temp_path, self.manifest_path)
+
+    def set_entities(self, entities):
+        self.entities = [dict(entity) for entity in entities]
+
+    @staticmethod
+    def _key(path):
+        return os.path.abspath(path)
+
+    def is_unchanged(self, path, entity_set_version):
+        entry = self.entries.get(self._key(path))
+        if entry is None or entry['entity_set_version'] != entity_set_version:
+            return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if stat.st_size != entry['size']:
+            return False
+        if stat.st_mtime == entry['mtime']:
+            return True
+        # Copied or touched files get a new mtime, the content decides
+        if file_content_hash(path) == entry['hash']:
+            entry['mtime'] = stat.st_mtime
+            return True
+        return False
+
+    def filter_changed(self, paths, entity_set_version):
+        return [path for path in paths if not self.is_unchanged(path, entity_set_version)]
+
+    def record(self, path, entity_set_version):
+        stat = os.stat(path)
+        self.entries[self._key(path)] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'hash': file_content_hash(path),
+                                         'entity_set_version': entity_set_version}
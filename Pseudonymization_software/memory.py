@@ -1,12 +1,17 @@
 
+from document_store import DocumentStore
+from entity_registry import EntityRegistry
+
 
 class RunTimeMemory:
     needs_ocr = []
     org_file_paths = []
     log_file_errors = {}  # {path: error_message}
     pseudo_file_paths = []
-    file_data = {}  # {path: [data]}
-    found_entities = []  # [{'UID': text+entity_type, 'word': text, 'entity_type': entity_type, 'ner_method': ner_method, 'score':score, 'replacement': replacement}]
+    file_data = {}  # {path: SpanStore}
+    content_hashes = {}  # {content_hash: first path read with that content}
+    duplicate_files = {}  # {path: path of identical file read earlier}
+    found_entities = EntityRegistry()  # [{'UID': text+entity_type, 'word': text, 'entity_type': entity_type, 'ner_method': ner_method, 'score':score, 'replacement': replacement}]
 
 
     def get_memory_values(self, name_of_variable):
@@ -18,10 +23,21 @@ class RunTimeMemory:
         except AttributeError:
             raise ValueError(f"Variable named '{name_of_variable}' does not exist in the class")
 
+    def use_document_store(self, max_resident=64, db_path=None):
+        """Keeps only max_resident documents of file_data in memory and the rest in a SQLite file."""
+        documents = DocumentStore(max_resident=max_resident, db_path=db_path)
+        documents.update(self.file_data)
+        self.file_data = documents
+
     def clear_memory(self):
         self.needs_ocr = []
         self.org_file_paths = []
         self.pseudo_file_paths = []
 
         self.log_file_errors = {}
-        self.file_data = {}
+        if isinstance(self.file_data, DocumentStore):
+            self.file_data.clear()
+        else:
+            self.file_data = {}
+        self.content_hashes = {}
+        self.duplicate_files = {}
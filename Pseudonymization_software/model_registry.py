@@ -0,0 +1,64 @@
+import json
+import threading
+
+import spacy
+from transformers import pipeline
+from transformers import AutoTokenizer, AutoModelForTokenClassification
+from presidio_analyzer.nlp_engine import SpacyNlpEngine
+
+from onnx_backend import BACKENDS, load_onnx_token_model
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded models. Every model is loaded once, on first use, and the same
+    object is handed to everyone asking for it, so the spaCy model is shared by both Presidio
+    analyzers and the spaCy method, and the FinBERT weights by all token-classification pipelines.
+    """
+    _models = {}
+    _lock = threading.RLock()
+
+    @classmethod
+    def _get(cls, key, loader):
+        with cls._lock:
+            if key not in cls._models:
+                cls._models[key] = loader()
+            return cls._models[key]
+
+    @classmethod
+    def get_spacy(cls, model_name):
+        return cls._get(('spacy', model_name), lambda: spacy.load(model_name))
+
+    @classmethod
+    def get_tokenizer(cls, model_id):
+        return cls._get(('tokenizer', model_id), lambda: AutoTokenizer.from_pretrained(model_id))
+
+    @classmethod
+    def get_token_model(cls, model_id, backend="pytorch"):
+        """backend is one of onnx_backend.BACKENDS, the ONNX ones need optimum[onnxruntime]."""
+        def load():
+            if backend == "pytorch":
+                return AutoModelForTokenClassification.from_pretrained(model_id)
+            elif backend in BACKENDS:
+                return load_onnx_token_model(model_id, quantize=backend == "onnx-int8")
+            raise ValueError(f"Unknown inference backend {backend}, use one of {BACKENDS}.")
+        return cls._get(('token_model', model_id, backend), load)
+
+    @classmethod
+    def get_token_pipeline(cls, model_id, aggregation_strategy="simple", ignore_labels=None, backend="pytorch"):
+        """Pipelines differ only by their post-processing, the model and tokenizer are shared."""
+        def load():
+            kwargs = {'ignore_labels': list(ignore_labels)} if ignore_labels is not None else {}
+            return pipeline("token-classification", model=cls.get_token_model(model_id, backend), tokenizer=cls.get_tokenizer(model_id),
+                            aggregation_strategy=aggregation_strategy, **kwargs)
+        key = ('token_pipeline', model_id, aggregation_strategy, tuple(ignore_labels) if ignore_labels is not None else None, backend)
+        return cls._get(key, load)
+
+    @classmethod
+    def get_nlp_engine(cls, configuration):
+        """Presidio spaCy NLP engine that uses the shared spaCy models instead of loading its own."""
+        def load():
+            engine = SpacyNlpEngine(models=configuration['models'])
+            engine.nlp = {model['lang_code']: cls.get_spacy(model['model_name']) for model in configuration['models']}
+            return engine
+        return cls._get(('nlp_engine', json.dumps(configuration, sort_keys=True)), load)
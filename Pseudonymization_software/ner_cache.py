@@ -0,0 +1,75 @@
+import hashlib
+import json
+import sqlite3
+import time
+
+
+class NERResultCache:
+    """
+    Persistent cache of raw detections per text chunk, so repeated paragraphs (terms and conditions,
+    headers, signature blocks) go through the models only once. Keys are hashes of the chunk text
+    and the detector setup, values are the detected words before filtering and replacements.
+
+    Size is bounded by max_entries, the least recently used entries are evicted. The cache keeps
+    detected words on disk, so it is opt-in like the extraction cache.
+    """
+
+    def __init__(self, db_path="ner_cache.sqlite", max_entries=100000):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(db_path, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS detections (key TEXT PRIMARY KEY, words TEXT, last_used REAL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS detections_last_used ON detections (last_used)")
+        self._count = self.connection.execute("SELECT COUNT(*) FROM detections").fetchone()[0]
+
+    @staticmethod
+    def make_key(text, detector_version, confidence_score, better_accu_more_fp):
+        """detector_version is TextEntityFinder.entity_set_version(), it covers the model and entity setup."""
+        setup = json.dumps([detector_version, confidence_score, better_accu_more_fp])
+        return hashlib.sha256((setup + "\n" + text).encode('utf-8')).hexdigest()
+
+    def get_many(self, keys):
+        """Returns {key: words} for the keys found in the cache."""
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        for start in range(0, len(unique_keys), 500):  # SQLite limits the number of query parameters
+            part = unique_keys[start:start + 500]
+            rows = self.connection.execute(f"SELECT key, words FROM detections WHERE key IN ({','.join('?' * len(part))})", part)
+            found.update((key, json.loads(words)) for key, words in rows)
+        if found:
+            now = time.time()
+            self.connection.execute("BEGIN")
+            self.connection.executemany("UPDATE detections SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+            self.connection.execute("COMMIT")
+        self.hits += sum(1 for key in keys if key in found)
+        self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, items):
+        """Stores [(key, words)]. Words are serialized right away, so they can be changed after this.
+        Transformer scores are numpy floats, they are stored as plain floats."""
+        if not items:
+            return
+        now = time.time()
+        self.connection.execute("BEGIN")
+        for key, words in items:
+            cursor = self.connection.execute("INSERT OR IGNORE INTO detections (key, words, last_used) VALUES (?, ?, ?)",
+                                             (key, json.dumps(words, ensure_ascii=False, default=float), now))
+            self._count += cursor.rowcount
+        self.connection.execute("COMMIT")
+        if self._count > self.max_entries:
+            self.evict()
+
+    def evict(self):
+        # A tenth extra is removed, so the next puts don't have to evict again right away
+        target = int(self.max_entries * 0.9)
+        self.connection.execute("DELETE FROM detections WHERE key IN (SELECT key FROM detections ORDER BY last_used LIMIT ?)",
+                                (max(self._count - target, 0),))
+        self._count = self.connection.execute("SELECT COUNT(*) FROM detections").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,107 @@
+import multiprocessing
+import os
+import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from chunker import iter_batches
+
+
+# Finder of the parent process, set before the workers are forked so they inherit the loaded models
+_finder = None
+
+
+def _init_worker(threads_per_worker):
+    import torch
+    # Every worker gets its own slice of the cores, otherwise each one starts a thread per core
+    torch.set_num_threads(threads_per_worker)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+
+def _detect_in_worker(chunks, to_keep_list, better_accu_more_fp, batch_size):
+    _finder.to_keep_list = to_keep_list  # may have changed after the fork
+    return _finder.detect_entities_batch(chunks, better_accu_more_fp, batch_size)
+
+
+class NERWorkerPool:
+    """
+    Runs TextEntityFinder detection in forked worker processes. Models are loaded once in the parent
+    before forking, so the workers share the weights copy-on-write instead of loading their own. The
+    workers only detect, found words are registered in the parent in chunk order, so found entities
+    and replacements are the same as with a single process. Falls back to the parent process when
+    fork isn't available (Windows), as spawned workers would each load the models again.
+    """
+
+    def __init__(self, entity_finder, workers=None, threads_per_worker=1, batch_size=16):
+        self.entity_finder = entity_finder
+        self.threads_per_worker = threads_per_worker
+        self.workers = workers or max(1, (os.cpu_count() or 1) // threads_per_worker)
+        self.batch_size = batch_size
+        self.executor = None
+        self.use_fork = "fork" in multiprocessing.get_all_start_methods()
+        if not self.use_fork:
+            warnings.warn("NERWorkerPool: fork is not available on this platform, entities are found in the main process.")
+
+    def preload(self):
+        """Loads every model used in detection, before the workers are forked."""
+        finder = self.entity_finder
+        finder.transformers_recognizer.pipeline
+        if finder.detection_profile == "fast":
+            finder.regex_recognizers
+            return
+        finder.spacy_nlp
+        finder.comp_analyzer
+        finder.trad_analyzer
+
+    def _start(self):
+        global _finder
+        self.preload()
+        _finder = self.entity_finder
+        os.environ["TOKENIZERS_PARALLELISM"] = "false"
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("fork"),
+                                            initializer=_init_worker, initargs=(self.threads_per_worker,))
+
+    def find_entities(self, text_chunks, faker_replacements=True, safe_approach=True, better_accu_more_fp=True, confidence_score:int=0.5):
+        """Same as TextEntityFinder.find_entities_in_chunks with the workers. Returns the number of chunks handled."""
+        return self.entity_finder.find_entities_in_chunks(text_chunks, faker_replacements, safe_approach, better_accu_more_fp,
+                                                          confidence_score, self.batch_size, detector=self)
+
+    def iter_detections(self, text_chunks, better_accu_more_fp=True, confidence_score:int=0.5, batch_size=None):
+        """Yields (chunk, detected words) in chunk order, like TextEntityFinder.iter_detections."""
+        finder = self.entity_finder
+        batch_size = batch_size or self.batch_size
+        if not self.use_fork:
+            yield from finder.iter_detections(text_chunks, better_accu_more_fp, confidence_score, batch_size)
+            return
+
+        if self.executor is None:
+            self._start()
+
+        def collect(item):
+            batch, all_words, missing, future = item
+            if future is not None:
+                detected = future.result()
+                for ind, comb_words in zip(missing, detected):
+                    all_words[ind] = comb_words
+                finder.cache_detections([batch[ind] for ind in missing], detected, better_accu_more_fp, confidence_score)
+            return zip(batch, all_words)
+
+        # Results are yielded in submission order, a few batches per worker are kept in flight.
+        # Cached chunks are not sent to the workers.
+        pending = deque()
+        # Windows like in TextEntityFinder.iter_detections, so the batch scheduler of a worker has chunks to sort
+        for batch in iter_batches(text_chunks, max(batch_size, finder.schedule_window)):
+            all_words = finder.cached_detections(batch, better_accu_more_fp, confidence_score)
+            missing = [ind for ind, words in enumerate(all_words) if words is None]
+            future = self.executor.submit(_detect_in_worker, [str(batch[ind]) for ind in missing], list(finder.to_keep_list),
+                                          better_accu_more_fp, batch_size) if missing else None
+            pending.append((batch, all_words, missing, future))
+            if len(pending) >= self.workers * 2:
+                yield from collect(pending.popleft())
+        while pending:
+            yield from collect(pending.popleft())
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
@@ -0,0 +1,137 @@
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz
+
+from span_store import SpanStore
+
+
+class OCRBackend:
+    """
+    Interface for local OCR engines. recognize() gets one rasterized page as PNG bytes and returns
+    its text lines in reading order as [(text, (x0, y0, x1, y1))] in image pixels. A line with text
+    ' ' marks a paragraph break. Backends are sent to worker processes, so they must be picklable.
+    """
+
+    def recognize(self, png_bytes, width, height):
+        raise NotImplementedError
+
+
+class TesseractBackend(OCRBackend):
+    """OCR with a local Tesseract install through pytesseract (optional dependency)."""
+
+    def __init__(self, lang="fin+eng", config=""):
+        self.lang = lang
+        self.config = config
+
+    def recognize(self, png_bytes, width, height):
+        try:
+            import pytesseract
+            from PIL import Image
+        except ImportError as err:
+            raise ImportError(f"TesseractBackend needs pytesseract and a Tesseract install: {err}")
+        image = Image.open(io.BytesIO(png_bytes))
+        data = pytesseract.image_to_data(image, lang=self.lang, config=self.config, output_type=pytesseract.Output.DICT)
+        # Tesseract gives words, they are joined into lines to match the span granularity of the PDF reader
+        lines = {}
+        for ind, word in enumerate(data['text']):
+            if not word.strip():
+                continue
+            key = (data['block_num'][ind], data['par_num'][ind], data['line_num'][ind])
+            x0, y0 = data['left'][ind], data['top'][ind]
+            x1, y1 = x0 + data['width'][ind], y0 + data['height'][ind]
+            if key not in lines:
+                lines[key] = [[word], x0, y0, x1, y1]
+            else:
+                line = lines[key]
+                line[0].append(word)
+                line[1], line[2], line[3], line[4] = min(line[1], x0), min(line[2], y0), max(line[3], x1), max(line[4], y1)
+        results = []
+        previous_paragraph = None
+        for key, (words, x0, y0, x1, y1) in lines.items():
+            if previous_paragraph is not None and key[:2] != previous_paragraph:
+                results.append((' ', (x0, y0, x0, y1)))
+            previous_paragraph = key[:2]
+            results.append((" ".join(words), (x0, y0, x1, y1)))
+        return results
+
+
+class FakeOCRBackend(OCRBackend):
+    """Returns the same lines for every page, for testing the OCR stage without an OCR engine."""
+
+    def __init__(self, lines=None):
+        self.lines = lines if lines is not None else ["Tämä teksti on tunnistettu kuvasta."]
+
+    def recognize(self, png_bytes, width, height):
+        return [(text, (50, 50 + ind * 40, 50 + len(text) * 15, 80 + ind * 40)) for ind, text in enumerate(self.lines)]
+
+
+def ocr_page_in_worker(file_path, page_num, backend, dpi):
+    """Process pool entry point: rasterizes one page and returns it in the reader page format."""
+    with fitz.open(file_path) as doc:
+        page = doc[page_num]
+        pixmap = page.get_pixmap(dpi=dpi)
+        lines = backend.recognize(pixmap.tobytes("png"), pixmap.width, pixmap.height)
+        width, height = page.rect.width, page.rect.height
+    scale = 72 / dpi  # pixels to PDF points
+    page_data = {'page': page_num, 'content': [], 'orientation': 'landscape' if width > height else 'portrait', 'size': (width, height)}
+    for text, (x0, y0, x1, y1) in lines:
+        location = (round(x0 * scale, 1), round(y0 * scale, 1), round(x1 * scale, 1), round(y1 * scale, 1))
+        page_data['content'].append({'type': 'text', 'text': text, 'font': 'OCR', 'size': round(max((y1 - y0) * scale, 1.0), 1),
+                                     'location': location})
+    return page_data
+
+
+class OCRProcessor:
+    """
+    Drains RunTimeMemory.needs_ocr. Pages of all queued PDFs are OCR'd in parallel in a process
+    pool, so a long scanned drawing set doesn't hold the rest of the batch, and the results are
+    stored to file_data like any read file.
+    """
+
+    def __init__(self, memory, backend, workers=None, dpi=300):
+        self.memory = memory
+        self.backend = backend
+        self.workers = workers or os.cpu_count()
+        self.dpi = dpi
+
+    def process_queue(self):
+        """OCRs the queued files and returns the paths that got text, in queue order."""
+        queue = list(dict.fromkeys(self.memory.needs_ocr))
+        page_counts = {}
+        for path in queue:
+            if os.path.splitext(path)[1].lower() != '.pdf':
+                print(f"OCR: Only PDF files can be OCR'd, {path} was left in the queue.")
+            elif path in self.memory.duplicate_files and self.memory.duplicate_files[path] in queue:
+                continue  # shares the result of the identical file
+            else:
+                try:
+                    with fitz.open(path) as doc:
+                        page_counts[path] = doc.page_count
+                except Exception as err:
+                    self.memory.log_file_errors[path] = f"OCR: {err}"
+
+        done_paths = []
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = {path: [executor.submit(ocr_page_in_worker, path, page_num, self.backend, self.dpi) for page_num in range(count)]
+                       for path, count in page_counts.items()}
+            for ind, path in enumerate(queue, start=1):
+                if path in futures:
+                    try:
+                        store = SpanStore.from_pages(future.result() for future in futures[path])
+                    except Exception as err:
+                        self.memory.log_file_errors[path] = f"OCR: {err}"
+                        continue
+                    if store.text_length() < 10:
+                        print(f"OCR: No text found in {path}.")
+                        continue
+                    self.memory.file_data[path] = store
+                elif self.memory.duplicate_files.get(path) in self.memory.file_data:
+                    self.memory.file_data[path] = self.memory.file_data[self.memory.duplicate_files[path]]
+                else:
+                    continue
+                self.memory.needs_ocr.remove(path)
+                done_paths.append(path)
+                print(f"OCR: {ind}. file handled from total of {len(queue)} files.")
+        return done_paths
@@ -0,0 +1,47 @@
+import os
+import platform
+
+
+BACKENDS = ["pytorch", "onnx", "onnx-int8"]
+
+
+def _import_optimum():
+    try:
+        from optimum.onnxruntime import ORTModelForTokenClassification, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    except ImportError as err:
+        raise ImportError(f"ONNX backend needs optimum with onnxruntime (pip install optimum[onnxruntime]): {err}")
+    return ORTModelForTokenClassification, ORTQuantizer, AutoQuantizationConfig
+
+
+def _quantization_config(auto_config):
+    # Dynamic quantization, so no calibration data is needed
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return auto_config.arm64(is_static=False, per_channel=False)
+    return auto_config.avx2(is_static=False, per_channel=False)
+
+
+def load_onnx_token_model(model_id, quantize=False, export_dir="onnx_models"):
+    """
+    Returns an ONNX Runtime token-classification model for the given Hugging Face model. The model
+    is exported to ONNX once and saved under export_dir, with quantize=True the exported model is
+    also quantized to int8. The returned model works with the transformers pipeline like the
+    PyTorch model, so aggregation and labels stay the same.
+    """
+    ORTModelForTokenClassification, ORTQuantizer, AutoQuantizationConfig = _import_optimum()
+    model_dir = os.path.join(export_dir, model_id.replace("/", "__"))
+    if not os.path.exists(os.path.join(model_dir, "model.onnx")):
+        print(f"Exporting {model_id} to ONNX, this is done only once.")
+        model = ORTModelForTokenClassification.from_pretrained(model_id, export=True)
+        model.save_pretrained(model_dir)
+        if not quantize:
+            return model
+    if not quantize:
+        return ORTModelForTokenClassification.from_pretrained(model_dir)
+
+    quantized_dir = model_dir + "_int8"
+    if not os.path.exists(os.path.join(quantized_dir, "model_quantized.onnx")):
+        print(f"Quantizing {model_id} to int8, this is done only once.")
+        quantizer = ORTQuantizer.from_pretrained(model_dir)
+        quantizer.quantize(save_dir=quantized_dir, quantization_config=_quantization_config(AutoQuantizationConfig))
+    return ORTModelForTokenClassification.from_pretrained(quantized_dir, file_name="model_quantized.onnx")
@@ -3,10 +3,8 @@ from pdfminer.high_level import extract_pages
 from pdfminer.layout import LTTextContainer, LTChar, LTTextLine
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4, landscape
-from PIL import Image
 import os
 import re
-import io
 import pandas as pd
 
 from memory import RunTimeMemory
@@ -135,19 +133,15 @@ class PDFAnonymizer:
 
         def replace_func(match):
             word = match.group(0)
-            # Find the replacement for the matched word. Assumes self.replacements is a list of dicts with 'word' and 'replacement' keys.
-            for replacement in self.replacements:
-                if replacement['word'] == word:
-                    return replacement['replacement']
+            # Find the replacement for the matched word from the word index of the entity registry
+            entity = self.replacements.get_by_word(word)
+            if entity is not None:
+                return entity['replacement']
             return word  # Return the word itself if no replacement is found (should not happen with a well-defined replacements list).
 
-        for page_data in data:
-            for content_item in page_data['content']:
-                if content_item['type'] == 'text':
-                    # Use the regex with replace_func to replace all matches in a single pass.
-                    content_item['text'] = regex.sub(replace_func, content_item['text'])
-
-        return data
+        # Use the regex with replace_func to replace all matches of each span in a single pass.
+        # Returns a new SpanStore, the one in memory is left untouched.
+        return data.with_texts(regex.sub(replace_func, span_text) for span_text in data.iter_texts())
 
 
 
@@ -157,7 +151,7 @@ class PDFAnonymizer:
         output_pdf_path = os.path.join(self.save_path, new_file_name.replace("\\", "__"))
         c = canvas.Canvas(output_pdf_path)
 
-        for page in data:
+        for page, spans in data.iter_pages():
             try:
                 width, height = page['size']
                 c.setPageSize((width, height))
@@ -170,33 +164,12 @@ class PDFAnonymizer:
                     width, height = landscape(A4)
                 c.setPageSize((width, height))
 
-            for item in page['content']:
-                if item['type'] == 'text':
-                    # Handle text
-                    text = item['text']
-                    font = item['font']
-                    size = item['size']
-                    x0, y0, x1, y1 = item['location']
-                    y = height - y1  # Adjust for ReportLab's coordinate system
-
-                    c.setFont("Helvetica", size)
-                    c.drawString(x0, y, text)
-
-                elif item['type'] == 'image':
-                    try:
-                        # Handle images
-                        image_data = item['image']
-                        x0, y0, x1, y1 = item['location']
-                        x, y, w, h = x0, height - y1, x1 - x0, y1 - y0  # Adjust dimensions and position
-
-                        # Use PIL to open the image from binary data
-                        # image = Image.open(io.BytesIO(image_data).getvalue())
-                        print((w, h))
-                        image = Image.frombytes('RGB', (round(w), round(h)), io.BytesIO(image_data).getvalue())
-                        print(image)
-                        c.drawInlineImage(image, x, y, width=w, height=h)
-                    except Exception as err:
-                        print(f"GOT THIS ERROR: {err}")
+            for text, font, size, location in spans:
+                x0, y0, x1, y1 = location
+                y = height - y1  # Adjust for ReportLab's coordinate system
+
+                c.setFont("Helvetica", size)
+                c.drawString(x0, y, text)
             c.showPage()  # End the current page and start a new one
         c.save()
 
@@ -0,0 +1,119 @@
+import queue
+import threading
+import zlib
+from collections import deque
+
+from faker import Faker
+
+
+class _TypePool:
+    """Generated values of one entity type, with its own Faker so the order of other types doesn't affect it."""
+
+    def __init__(self, entity_type, seed):
+        self.entity_type = entity_type
+        self.faker = Faker('fi_FI')
+        if seed is not None:
+            self.faker.seed_instance(seed + zlib.crc32(entity_type.encode('utf-8')))
+        self.values = deque()
+        self.generated = []  # every value in generation order, bases for numbered values
+        self.seen = set()
+        self.exhausted = False
+        self.refill_requested = False
+        self.next_number = 2
+        self.next_base = 0
+        self.lock = threading.Lock()
+
+
+class PseudonymPool:
+    """
+    Pre-generated replacement values per entity type. Values are generated in bulk with a Faker
+    fi_FI per type and refilled by a background thread when fewer than refill_below are left.
+    Issued values are kept in the used set (a hash set shared with TextEntityFinder.replacements),
+    so uniqueness checks don't scan a list. With a seed, the values of each type are the same in
+    every run. When Faker runs out of new values for a type (e.g. cities), values get a running
+    number: "^espoo 2", "^espoo 3" and so on.
+
+    make_value(faker, entity_type) returns one new value.
+    """
+
+    def __init__(self, make_value, seed=None, pool_size=500, refill_below=100, used=None, background=True):
+        self.make_value = make_value
+        self.seed = seed
+        self.pool_size = pool_size
+        self.refill_below = refill_below
+        self.used = used if used is not None else set()
+        self.background = background
+        self._pools = {}
+        self._pools_lock = threading.Lock()
+        self._refill_queue = queue.Queue()
+        self._refill_thread = None
+
+    def _get_pool(self, entity_type):
+        with self._pools_lock:
+            if entity_type not in self._pools:
+                self._pools[entity_type] = _TypePool(entity_type, self.seed)
+            return self._pools[entity_type]
+
+    def _fill(self, pool, count):
+        """Generates up to count new values. A type is exhausted when many draws give nothing new."""
+        with pool.lock:
+            added = 0
+            for _ in range(count * 20):
+                if added >= count:
+                    break
+                value = self.make_value(pool.faker, pool.entity_type)
+                if value not in pool.seen:
+                    pool.seen.add(value)
+                    pool.generated.append(value)
+                    pool.values.append(value)
+                    added += 1
+            if added == 0:
+                pool.exhausted = True
+            pool.refill_requested = False
+
+    def _refill_worker(self):
+        while True:
+            pool = self._refill_queue.get()
+            self._fill(pool, self.pool_size)
+
+    def _request_refill(self, pool):
+        if not self.background:
+            return
+        if self._refill_thread is None:
+            self._refill_thread = threading.Thread(target=self._refill_worker, name="PseudonymPoolRefill", daemon=True)
+            self._refill_thread.start()
+        pool.refill_requested = True
+        self._refill_queue.put(pool)
+
+    def _numbered_value(self, pool):
+        with pool.lock:
+            value = f"{pool.generated[pool.next_base]} {pool.next_number}"
+            pool.next_base += 1
+            if pool.next_base >= len(pool.generated):
+                pool.next_base = 0
+                pool.next_number += 1
+        return value
+
+    def _next_value(self, pool):
+        with pool.lock:
+            if pool.values:
+                value = pool.values.popleft()
+                if len(pool.values) < self.refill_below and not pool.exhausted and not pool.refill_requested:
+                    self._request_refill(pool)
+                return value
+        if pool.exhausted:
+            return self._numbered_value(pool) if pool.generated else None
+        self._fill(pool, self.pool_size)  # empty, filled here instead of waiting for the thread
+        return self._next_value(pool)
+
+    def take(self, entity_type, original_word=None):
+        """Returns an unused value for the type and marks it used."""
+        pool = self._get_pool(entity_type)
+        original = "^" + original_word.lower() if original_word else None
+        while True:
+            value = self._next_value(pool)
+            if value is None:
+                raise ValueError(f"PseudonymPool: No values can be generated for {entity_type}.")
+            if value not in self.used and value != original:
+                self.used.add(value)
+                return value
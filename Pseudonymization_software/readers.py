@@ -1,7 +1,12 @@
 import fitz
 import os
-from docx2pdf import convert as convert_to_pdf
-from doc2docx import convert as convert_to_docx
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+from docx_reader import DocxLayoutReader
+from extraction_cache import file_content_hash
+from span_store import SpanStore
 
 
 class DirReader:
@@ -30,11 +35,100 @@ class DirReader:
             raise Exception(f"DirReader: Error occurred while reading directory: {e}")
         return file_paths
 
+    @staticmethod
+    def get_changed_files_from_dir(path, max_depth, manifest, entity_set_version, allowed_types=None, workers=1):
+        """Lists only the files that are new or changed since the manifest last recorded them."""
+        files = DirReader.iter_files(path, max_depth, allowed_types=allowed_types, workers=workers)
+        return manifest.filter_changed(files, entity_set_version)
+
+    @staticmethod
+    def iter_files(path, max_depth, allowed_types=None, workers=1):
+        """
+        Yields file paths under path with os.scandir, in the same order as get_all_files_from_dir.
+
+        Only files whose extension is in allowed_types are yielded (all files if None). Directories
+        are visited once by device and inode, so symlink loops end. With workers > 1 the top-level
+        subdirectories are walked in a thread pool, which helps on slow network shares.
+        """
+        if path.startswith('"') or path.endswith('"'):
+            path = path.strip('"')
+        if not os.path.isdir(path):
+            raise NotADirectoryError("DirReader: Path is not a directory!")
+        allowed_types = set(allowed_types) if allowed_types is not None else None
+        visited = set()
+        visited_lock = threading.Lock()
+
+        def first_visit(dir_path):
+            stat = os.stat(dir_path)
+            key = (stat.st_dev, stat.st_ino)
+            with visited_lock:
+                if key in visited:
+                    return False
+                visited.add(key)
+                return True
+
+        def is_allowed(name):
+            return allowed_types is None or os.path.splitext(name)[1] in allowed_types
+
+        def scan(dir_path):
+            try:
+                with os.scandir(dir_path) as entries:
+                    return list(entries)
+            except OSError as err:
+                warnings.warn(f"DirReader: Skipping directory {dir_path} that couldn't be read: {err}")
+                return []
+
+        def walk_subtree(dir_path, depth):
+            # Iterative depth-first walk, the stack holds one entry iterator per open directory
+            files = []
+            if depth > max_depth or not first_visit(dir_path):
+                return files
+            stack = [(iter(scan(dir_path)), depth)]
+            while stack:
+                entries, current_depth = stack[-1]
+                entry = next(entries, None)
+                if entry is None:
+                    stack.pop()
+                    continue
+                try:
+                    if entry.is_dir():
+                        if current_depth + 1 <= max_depth and first_visit(entry.path):
+                            stack.append((iter(scan(entry.path)), current_depth + 1))
+                    elif entry.is_file() and is_allowed(entry.name):
+                        files.append(entry.path)
+                except OSError as err:
+                    warnings.warn(f"DirReader: Skipping {entry.path}: {err}")
+            return files
+
+        if not first_visit(path):
+            return
+        root_entries = scan(path)
+        subdirs = [entry.path for entry in root_entries if entry.is_dir()]
+        if workers > 1 and len(subdirs) > 1:
+            executor = ThreadPoolExecutor(max_workers=workers)
+            subtrees = {dir_path: executor.submit(walk_subtree, dir_path, 1) for dir_path in subdirs}
+        else:
+            executor = None
+            subtrees = {}
+        try:
+            for entry in root_entries:
+                if entry.is_dir():
+                    yield from subtrees[entry.path].result() if executor is not None else walk_subtree(entry.path, 1)
+                elif entry.is_file() and is_allowed(entry.name):
+                    yield entry.path
+        finally:
+            if executor is not None:
+                for future in subtrees.values():
+                    future.cancel()
+                executor.shutdown(wait=False)
+
 
 class FileReader:
+    EXTRACTOR_VERSION = 3  # bump when reader output changes, invalidates ExtractionCache entries
 
-    def __init__(self, memory, chunking: bool = False, chunk_max_length: int = 5000, chunk_endings: list = None, use_ocr_if_needed: bool = True):
+    def __init__(self, memory, chunking: bool = False, chunk_max_length: int = 5000, chunk_endings: list = None, use_ocr_if_needed: bool = True, cache=None):
         self.memory = memory
+        self.cache = cache  # ExtractionCache or None
         if chunk_endings is None:
             chunk_endings = ['\n\n', '\n']
         self.chunking = chunking
@@ -53,25 +147,60 @@ class FileReader:
         return list(self.file_readers().keys())
 
     def process_file(self, file_path):
+        self._get_read_function(file_path)
+        content_hash = self.get_content_hash(file_path)
+        if content_hash is not None and content_hash in self.memory.content_hashes:
+            return self._store_duplicate(file_path, content_hash)
+        data = self.extract_file(file_path, content_hash)
+        return self.store_file_data(file_path, data, content_hash)
+
+    def get_content_hash(self, file_path):
+        if self.cache is None:
+            return None
+        return file_content_hash(file_path)
+
+    def _get_read_function(self, file_path):
         name, file_extension = os.path.splitext(file_path)
         read_function = self.file_readers().get(file_extension)
         if read_function is None:
             raise TypeError(f"FileReader: Unsupported file type '{file_extension}' for file {file_path}. File wasn't read.")
+        return read_function
+
+    def extract_file(self, file_path, content_hash=None):
+        read_function = self._get_read_function(file_path)
+        if content_hash is not None:
+            data = self.cache.get(content_hash)
+            if data is not None:
+                return data
         try:
-            data = read_function(file_path)
-            text = ''.join(item['text'] for page in data for item in page['content'] if item['type'] == 'text')
-            """for page in data:
-                for item in page['content']:
-                    if item['type'] == 'text':
-                        text += item['text']"""
-            if len(text) < 10:
-                self.memory.needs_ocr.append(file_path)
-                return False
-            else:
-                self.memory.file_data[file_path] = data
-                return True
+            data = SpanStore.from_pages(read_function(file_path))
         except Exception as err:
             raise Exception(f"FileReader: While reading file, this error occurred: {err}")
+        if content_hash is not None:
+            self.cache.put(content_hash, data)
+        return data
+
+    def store_file_data(self, file_path, data, content_hash=None):
+        if content_hash is not None:
+            if content_hash in self.memory.content_hashes:
+                return self._store_duplicate(file_path, content_hash)
+            self.memory.content_hashes[content_hash] = file_path
+        if data.text_length() < 10:
+            self.memory.needs_ocr.append(file_path)
+            return False
+        else:
+            self.memory.file_data[file_path] = data
+            return True
+
+    def _store_duplicate(self, file_path, content_hash):
+        # Identical content under another path shares the already read data instead of a second copy
+        original_path = self.memory.content_hashes[content_hash]
+        self.memory.duplicate_files[file_path] = original_path
+        if original_path in self.memory.file_data:
+            self.memory.file_data[file_path] = self.memory.file_data[original_path]
+            return True
+        self.memory.needs_ocr.append(file_path)
+        return False
 
     def file_readers(self):
         return {
@@ -84,12 +213,60 @@ class FileReader:
             '.DOC': self.read_doc_file,
         }
 
+    def page_iterators(self):
+        # Readers that can yield pages one at a time, other file types are read whole and then iterated
+        return {
+            '.pdf': self.iter_pdf_pages,
+            '.PDF': self.iter_pdf_pages,
+        }
+
+    def iter_file_pages(self, file_path):
+        read_function = self._get_read_function(file_path)
+        page_iterator = self.page_iterators().get(os.path.splitext(file_path)[1])
+        try:
+            yield from page_iterator(file_path) if page_iterator is not None else read_function(file_path)
+        except Exception as err:
+            raise Exception(f"FileReader: While reading file, this error occurred: {err}")
+
+    def stream_file(self, file_path):
+        """
+        Generator version of process_file. Yields pages as they are read and stores the compact
+        SpanStore of the document in memory when the file is done, so only a window of page dicts
+        is alive at a time. Nothing is yielded for files that need OCR or duplicate an earlier file.
+        """
+        self._get_read_function(file_path)
+        content_hash = self.get_content_hash(file_path)
+        if content_hash is not None and content_hash in self.memory.content_hashes:
+            self._store_duplicate(file_path, content_hash)
+            return
+        cached = self.cache.get(content_hash) if content_hash is not None else None
+        store = cached if cached is not None else SpanStore()
+        pages = cached.iter_page_dicts() if cached is not None else self.iter_file_pages(file_path)
+        # Pages are held back until the document has enough text, as files needing OCR yield nothing
+        held_pages, text_length = [], 0
+        for page in pages:
+            if cached is None:
+                store.add_page_dict(page)
+            if held_pages is None:
+                yield page
+                continue
+            held_pages.append(page)
+            text_length += sum(len(item['text']) for item in page['content'] if item['type'] == 'text')
+            if text_length >= 10:
+                yield from held_pages
+                held_pages = None
+        if cached is None and content_hash is not None:
+            self.cache.put(content_hash, store)
+        self.store_file_data(file_path, store, content_hash)
+
     def read_txt_file(self, file_path):
         with open(file_path, 'r', encoding='utf-8') as file:
             return file.read()
 
-    def read_pdf_file_with_meta(self, file_path):  # TODO: enable OCR
-        data = []
+    def read_pdf_file_with_meta(self, file_path):  # files without text layer are handled by ocr.OCRProcessor
+        return list(self.iter_pdf_pages(file_path))
+
+    def iter_pdf_pages(self, file_path):
         with fitz.open(file_path) as doc:
             for page_num, page in enumerate(doc):
                 # Determine page orientation
@@ -108,13 +285,15 @@ class FileReader:
                                     'size': round(span['size'], 1),
                                     'location': (round(span['bbox'][0], 1), round(span['bbox'][1], 1), round(span['bbox'][2], 1), round(span['bbox'][3], 1))}
                                 page_data['content'].append(text_data)
-                data.append(page_data)
-        return data
+                yield page_data
 
     def convert_doc_to_docx(self, doc_path, docx_path):
+        # Converters need MS Word and are imported only when a conversion is actually done
+        from doc2docx import convert as convert_to_docx
         convert_to_docx(doc_path, docx_path)
 
     def convert_docx_to_pdf(self, docx_path, pdf_path):
+        from docx2pdf import convert as convert_to_pdf
         convert_to_pdf(docx_path, pdf_path)
 
     def read_doc_file(self, file_path):
@@ -122,23 +301,25 @@ class FileReader:
         if not os.path.exists(temp_folder):
             os.makedirs(temp_folder)
 
-        base_filename = os.path.splitext(os.path.basename(file_path))[0]
+        # pid prefix keeps parallel workers from overwriting each other's temp files
+        base_filename = f"{os.getpid()}_{os.path.splitext(os.path.basename(file_path))[0]}"
         temp_path = os.path.join(temp_folder, base_filename + ".docx")
-        pdf_path = os.path.join(temp_folder, base_filename + ".pdf")
 
         self.convert_doc_to_docx(file_path, temp_path)
-        self.convert_docx_to_pdf(temp_path, pdf_path)
-        data = self.read_pdf_file_with_meta(pdf_path)
+        data = self.read_docx_file(temp_path)
         os.remove(temp_path)
-        os.remove(pdf_path)
         return data
 
     def read_docx_file(self, file_path):
+        return DocxLayoutReader(file_path).read()
+
+    def read_docx_file_via_pdf(self, file_path):
+        """Old path with the real Word layout, needs docx2pdf and MS Word."""
         temp_folder = "temp_files"
         if not os.path.exists(temp_folder):
             os.makedirs(temp_folder)
 
-        base_filename = os.path.splitext(os.path.basename(file_path))[0]
+        base_filename = f"{os.getpid()}_{os.path.splitext(os.path.basename(file_path))[0]}"
         pdf_path = os.path.join(temp_folder, base_filename + ".pdf")
 
         self.convert_docx_to_pdf(file_path, pdf_path)
@@ -166,3 +347,10 @@ class FileReader:
             chunks.append(text[start:split_index + 1])
             start = split_index + 1
         return chunks
+
+
+def extract_file_in_worker(file_path, cache=None):
+    """Process pool entry point: reads one file without touching the shared memory."""
+    reader = FileReader(memory=None, cache=cache)
+    content_hash = reader.get_content_hash(file_path)
+    return content_hash, reader.extract_file(file_path, content_hash)
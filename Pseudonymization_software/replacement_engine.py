@@ -0,0 +1,135 @@
+import heapq
+from collections import deque
+
+
+class ReplacementEngine:
+    """
+    Aho-Corasick automaton over the entity words, built once per entity set. Text is scanned once
+    and every entity word found is replaced, leftmost-longest: at each position the longest word
+    wins, and replaced text is never scanned again, so a pseudonym can't be rewritten by a later
+    entity like with repeated str.replace calls. Matching is case-sensitive like before.
+
+    replace() handles one text, stream() returns a ReplacementStream for text that arrives in parts.
+    Both give the matches as (start, end, word), so the key map and audits come from the same pass.
+    """
+
+    def __init__(self, replacements):
+        """replacements is {word: replacement}, empty words are ignored."""
+        self.replacements = {word: replacement for word, replacement in replacements.items() if word}
+        self.max_length = max((len(word) for word in self.replacements), default=0)
+        self._goto = [{}]
+        self._fail = [0]
+        self._lengths = [()]  # lengths of the words ending at each node, also through fail links
+        self._build()
+
+    @classmethod
+    def from_entities(cls, entities):
+        """Uses the replacement of the first entity of each word, like a scan of the entity list would."""
+        replacements = {}
+        for entity in entities:
+            replacements.setdefault(entity['word'], entity['replacement'])
+        return cls(replacements)
+
+    def _build(self):
+        own_lengths = [[]]
+        for word in self.replacements:
+            node = 0
+            for char in word:
+                if char not in self._goto[node]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    own_lengths.append([])
+                    self._goto[node][char] = len(self._goto) - 1
+                node = self._goto[node][char]
+            own_lengths[node].append(len(word))
+
+        self._lengths = [tuple(lengths) for lengths in own_lengths]
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                if node == 0:
+                    continue  # children of the root fail back to the root
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._lengths[child] += self._lengths[self._fail[child]]
+
+    def stream(self):
+        return ReplacementStream(self)
+
+    def replace(self, text):
+        """Returns (replaced text, [(start, end, word)]) with positions in the original text."""
+        stream = self.stream()
+        replaced = stream.feed(text) + stream.finish()
+        return replaced, stream.matches
+
+    def find_matches(self, text):
+        return self.replace(text)[1]
+
+
+class ReplacementStream:
+    """
+    Incremental replacement over text parts. feed() returns the output that can't change any more:
+    everything before the last max_length - 1 characters, as a longer match may still start there.
+    finish() returns the rest. matches collects (start, end, word) with positions in the whole input.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.matches = []
+        self._node = 0
+        self._consumed = 0  # characters fed so far
+        self._buffer = ""  # input not written out yet, starts at _buffer_start
+        self._buffer_start = 0
+        self._longest = {}  # {start: end} of the longest word found starting there
+        self._starts = []  # heap of the keys of _longest
+
+    def feed(self, text):
+        goto, fail, lengths = self.engine._goto, self.engine._fail, self.engine._lengths
+        node = self._node
+        longest, starts = self._longest, self._starts
+        for ind, char in enumerate(text, start=self._consumed + 1):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for length in lengths[node]:
+                start = ind - length
+                if start not in longest:
+                    longest[start] = ind
+                    heapq.heappush(starts, start)
+                elif ind > longest[start]:
+                    longest[start] = ind
+        self._node = node
+        self._consumed += len(text)
+        self._buffer += text
+        return self._resolve(final=False)
+
+    def finish(self):
+        return self._resolve(final=True)
+
+    def _resolve(self, final):
+        # All words starting before limit are known, ones starting later may still be growing
+        limit = self._consumed if final else min(self._consumed, self._consumed - self.engine.max_length + 1)
+        buffer, buffer_start = self._buffer, self._buffer_start
+        position = buffer_start
+        output = []
+        while self._starts and self._starts[0] < limit:
+            start = heapq.heappop(self._starts)
+            end = self._longest.pop(start)
+            if start < position:
+                continue  # inside a word replaced already
+            word = buffer[start - buffer_start:end - buffer_start]
+            output.append(buffer[position - buffer_start:start - buffer_start])
+            output.append(self.engine.replacements[word])
+            self.matches.append((start, end, word))
+            position = end
+        plain_end = self._consumed if final else min(limit, self._starts[0]) if self._starts else limit
+        if plain_end > position:
+            output.append(buffer[position - buffer_start:plain_end - buffer_start])
+            position = plain_end
+        self._buffer = buffer[position - buffer_start:]
+        self._buffer_start = position
+        return "".join(output)
@@ -0,0 +1,138 @@
+from array import array
+
+
+class SpanStore:
+    """
+    Columnar storage for the text spans of one document.
+
+    Every span has an entry in the parallel arrays (page index, bbox, font size, interned font id)
+    and its text is a slice of one shared text buffer given by text_offsets. Page metadata is kept
+    once per page as {'page', 'orientation', 'size'} and page_starts tells where the spans of each
+    page begin. Stores are treated as immutable once built, with_texts() returns a new store.
+    """
+
+    def __init__(self):
+        self.pages = []  # [{'page': page_num, 'orientation': orientation, 'size': (width, height)}]
+        self.page_starts = array('I')
+        self.page_index = array('I')
+        self.x0 = array('f')
+        self.y0 = array('f')
+        self.x1 = array('f')
+        self.y1 = array('f')
+        self.size = array('f')
+        self.font_id = array('I')
+        self.fonts = []
+        self._font_ids = {}
+        self.text_offsets = array('I', [0])
+        self._text = ""
+        self._text_parts = []
+        self._page_part_start = 0
+
+    @classmethod
+    def from_pages(cls, pages):
+        """Builds a store from the reader format [{'page', 'content', 'orientation', 'size'}]."""
+        store = cls()
+        for page in pages:
+            store.add_page_dict(page)
+        return store
+
+    def add_page_dict(self, page):
+        self.add_page(page['page'], page['orientation'], page['size'])
+        for item in page['content']:
+            if item['type'] == 'text':
+                self.add_span(item['text'], item['font'], item['size'], item['location'])
+
+    def add_page(self, page_num, orientation, size):
+        # Texts of the finished page are merged into one string, so a long build keeps one part per page
+        self._text_parts[self._page_part_start:] = ["".join(self._text_parts[self._page_part_start:])]
+        self._page_part_start = len(self._text_parts)
+        self.pages.append({'page': page_num, 'orientation': orientation, 'size': size})
+        self.page_starts.append(len(self.page_index))
+
+    def add_span(self, text, font, size, location):
+        font_id = self._font_ids.get(font)
+        if font_id is None:
+            font_id = len(self.fonts)
+            self._font_ids[font] = font_id
+            self.fonts.append(font)
+        self.page_index.append(len(self.pages) - 1)
+        self.x0.append(location[0])
+        self.y0.append(location[1])
+        self.x1.append(location[2])
+        self.y1.append(location[3])
+        self.size.append(size)
+        self.font_id.append(font_id)
+        self._text_parts.append(text)
+        self.text_offsets.append(self.text_offsets[-1] + len(text))
+
+    @property
+    def text(self):
+        if self._text_parts:
+            self._text += "".join(self._text_parts)
+            self._text_parts = []
+            self._page_part_start = 0
+        return self._text
+
+    def __len__(self):
+        return len(self.page_index)
+
+    def text_length(self):
+        return self.text_offsets[-1]
+
+    def get_text(self, ind):
+        return self.text[self.text_offsets[ind]:self.text_offsets[ind + 1]]
+
+    def iter_texts(self, start=0, end=None):
+        text = self.text
+        offsets = self.text_offsets
+        for ind in range(start, len(self) if end is None else end):
+            yield text[offsets[ind]:offsets[ind + 1]]
+
+    def get_span(self, ind):
+        """Returns (text, font, size, location) with values rounded like the readers round them."""
+        location = (round(self.x0[ind], 1), round(self.y0[ind], 1), round(self.x1[ind], 1), round(self.y1[ind], 1))
+        return self.get_text(ind), self.fonts[self.font_id[ind]], round(self.size[ind], 1), location
+
+    def page_span_range(self, page_pos):
+        start = self.page_starts[page_pos]
+        end = self.page_starts[page_pos + 1] if page_pos + 1 < len(self.pages) else len(self)
+        return start, end
+
+    def iter_pages(self):
+        """Yields (page_meta, spans) where spans are (text, font, size, location) tuples of the page."""
+        for page_pos, page in enumerate(self.pages):
+            start, end = self.page_span_range(page_pos)
+            yield page, (self.get_span(ind) for ind in range(start, end))
+
+    def iter_page_dicts(self):
+        """Yields pages in the reader format for code that still needs per-span dicts."""
+        for page, spans in self.iter_pages():
+            content = [{'type': 'text', 'text': text, 'font': font, 'size': size, 'location': location}
+                       for text, font, size, location in spans]
+            yield {'page': page['page'], 'content': content, 'orientation': page['orientation'], 'size': page['size']}
+
+    def to_pages(self):
+        return list(self.iter_page_dicts())
+
+    def with_texts(self, texts):
+        """Returns a new store with the same layout and the given span texts, in span order."""
+        new = SpanStore.__new__(SpanStore)
+        new.__dict__.update(self.__dict__)
+        new._text_parts = []
+        new._page_part_start = 0
+        new.text_offsets = array('I', [0])
+        parts = []
+        for text in texts:
+            parts.append(text)
+            new.text_offsets.append(new.text_offsets[-1] + len(text))
+        if len(parts) != len(self):
+            raise ValueError(f"SpanStore: Expected {len(self)} texts but got {len(parts)}.")
+        new._text = "".join(parts)
+        return new
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_text'] = self.text
+        state['_text_parts'] = []
+        state['_page_part_start'] = 0
+        return state
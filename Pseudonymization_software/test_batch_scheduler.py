@@ -0,0 +1,47 @@
+import random
+
+from batch_scheduler import TokenBudgetScheduler
+
+
+class WordTokenizer:
+    """One token per word and two special tokens, like the model tokenizer is called by the scheduler."""
+
+    def __call__(self, texts, add_special_tokens=True, truncation=True):
+        return {'input_ids': [[0] * (len(text.split()) + 2) for text in texts]}
+
+
+def mixed_length_texts(count=256, seed=0):
+    rng = random.Random(seed)
+    # Table cells, sentences and long paragraphs mixed, like the chunks of one contract
+    return [" ".join(["sana"] * rng.choice([1, 3, 20, 120, 400])) + f" {ind}" for ind in range(count)]
+
+
+def test_results_come_back_in_input_order():
+    calls = []
+
+    def predict(texts, batch_size):
+        calls.append(texts)
+        return [text.upper() for text in texts]
+
+    texts = mixed_length_texts()
+    assert TokenBudgetScheduler(WordTokenizer()).run(texts, predict) == [text.upper() for text in texts]
+    assert sorted(text for batch in calls for text in batch) == sorted(texts)
+
+
+def test_mixed_lengths_are_packed_into_fewer_padded_tokens():
+    texts = mixed_length_texts()
+    scheduler = TokenBudgetScheduler(WordTokenizer(), max_batch_tokens=4096, max_batch_size=64)
+    scheduler.run(texts, lambda batch, batch_size: [None] * len(batch))
+    stats = scheduler.stats()
+    # The whole queue is sorted, not only max_batch_size texts at a time
+    assert stats['padded_tokens'] * 2 < scheduler.unscheduled_padded_tokens
+    assert stats['padding_waste'] < 0.2 < stats['unscheduled_padding_waste']
+
+
+def test_batches_stay_under_the_token_budget():
+    scheduler = TokenBudgetScheduler(WordTokenizer(), max_batch_tokens=1024, max_batch_size=64)
+    lengths = scheduler.token_lengths(mixed_length_texts())
+    for batch in scheduler.plan(lengths):
+        padded = len(batch) * max(lengths[ind] for ind in batch)
+        assert len(batch) <= 64
+        assert padded <= 1024 or len(batch) == 1
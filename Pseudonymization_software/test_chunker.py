@@ -0,0 +1,79 @@
+import re
+
+from chunker import TextChunk, TokenAwareChunker, merge_chunk_detections
+
+
+class PieceTokenizer:
+    """Splits every word into tokens of piece_length characters, with offsets like a fast tokenizer."""
+    model_max_length = 512
+
+    def __init__(self, piece_length=2):
+        self.piece_length = piece_length
+
+    def num_special_tokens_to_add(self):
+        return 2
+
+    def __call__(self, text, add_special_tokens=False, return_offsets_mapping=True):
+        offsets = []
+        for match in re.finditer(r"\S+", text):
+            for start in range(match.start(), match.end(), self.piece_length):
+                offsets.append((start, min(start + self.piece_length, match.end())))
+        return {'offset_mapping': offsets}
+
+
+def assert_chunks_start_at_words(document, chunks):
+    for chunk in chunks:
+        assert document[chunk.start:chunk.start + len(chunk)] == chunk
+        assert chunk.start == 0 or document[chunk.start - 1].isspace(), chunk
+
+
+def test_overlap_never_starts_inside_a_word():
+    # Words of ten or eleven tokens in chunks of twelve, so no word starts inside the overlap windows
+    paragraph = " ".join(f"{letter * 19}{ind}" for ind, letter in enumerate("abcdefghijklmnopqrstuvwxyz"))
+    chunker = TokenAwareChunker(PieceTokenizer(), max_tokens=12, overlap_tokens=3)
+    chunks = list(chunker.chunk_stream([paragraph]))
+    assert len(chunks) > 1
+    assert_chunks_start_at_words(paragraph, chunks)
+    assert chunks[-1].start + len(chunks[-1]) == len(paragraph)
+
+
+def test_overlap_is_kept_when_a_word_starts_inside_it():
+    paragraph = " ".join(f"w{ind}" for ind in range(200))
+    chunker = TokenAwareChunker(PieceTokenizer(), max_tokens=40, overlap_tokens=8)
+    chunks = list(chunker.chunk_stream([paragraph]))
+    assert_chunks_start_at_words(paragraph, chunks)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk.start < previous.start + len(previous)
+
+
+def detect_names(chunk, names):
+    """Fake NER: every occurrence of the names, with offsets in the chunk like the detectors give them."""
+    words = []
+    for name in names:
+        for match in re.finditer(re.escape(name), chunk):
+            words.append({'UID': name + 'PERSON', 'word': name, 'entity_type': 'PERSON', 'score': 0.9,
+                          'start': match.start(), 'end': match.end()})
+    return words
+
+
+def test_merged_offsets_point_to_the_document_and_overlap_is_counted_once():
+    names = ["Matti Virtanen", "Liisa Korhonen"]
+    filler = " ".join(f"sana{ind}" for ind in range(40))
+    paragraphs = [f"{filler} Matti Virtanen {filler} Liisa Korhonen {filler}", "Lyhyt kappale Liisa Korhonen.", filler]
+    chunker = TokenAwareChunker(PieceTokenizer(), max_tokens=60, overlap_tokens=20)
+    document = TokenAwareChunker.SEPARATOR.join(paragraphs)
+    chunks = list(chunker.chunk_stream(paragraphs))
+    assert len(chunks) > 3
+
+    merged = [word for words in merge_chunk_detections((chunk, detect_names(chunk, names)) for chunk in chunks) for word in words]
+    for word in merged:
+        assert document[word['start']:word['end']] == word['word']
+    found = sorted((word['start'], word['end']) for word in merged)
+    expected = sorted((match.start(), match.end()) for name in names for match in re.finditer(re.escape(name), document))
+    assert found == expected
+
+
+def test_plain_string_chunks_are_passed_through():
+    words = [{'UID': 'aPERSON', 'word': 'a', 'entity_type': 'PERSON', 'score': 0.9, 'start': 0, 'end': 1}]
+    assert list(merge_chunk_detections([("a b", words)])) == [words]
+    assert list(merge_chunk_detections([(TextChunk("a b", 10), [dict(words[0])])]))[0][0]['start'] == 10
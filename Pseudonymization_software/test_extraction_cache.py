@@ -0,0 +1,26 @@
+import os
+
+from extraction_cache import ExtractionCache
+
+
+def cache_dir_size(cache_dir):
+    return sum(entry.stat().st_size for entry in os.scandir(cache_dir) if entry.name.endswith(ExtractionCache.FILE_SUFFIX))
+
+
+def test_size_limit_holds_while_putting(tmp_path):
+    cache = ExtractionCache(cache_dir=str(tmp_path), max_size_mb=0.1)
+    for ind in range(40):
+        # Random bytes don't compress, so every entry is about 10 KB, 400 KB in total
+        cache.put(f"hash{ind}", os.urandom(10 * 1024))
+        assert cache_dir_size(tmp_path) <= cache.max_size_bytes
+    assert cache.total_size == cache_dir_size(tmp_path)
+    # The least recently used entries went first
+    assert cache.get("hash39") is not None
+    assert cache.get("hash0") is None
+
+
+def test_replacing_an_entry_is_not_counted_twice(tmp_path):
+    cache = ExtractionCache(cache_dir=str(tmp_path), max_size_mb=1)
+    for _ in range(5):
+        cache.put("same", os.urandom(10 * 1024))
+    assert cache.total_size == cache_dir_size(tmp_path)
@@ -0,0 +1,32 @@
+import json
+
+from manifest import FileManifest
+
+
+def test_entities_are_kept_with_the_recorded_files(tmp_path):
+    manifest_path = str(tmp_path / "file_manifest.json")
+    document = tmp_path / "sopimus.txt"
+    document.write_text("Matti Virtanen", encoding='utf-8')
+    entities = [{'UID': 'Matti VirtanenPERSON', 'word': 'Matti Virtanen', 'entity_type': 'PERSON', 'replacement': '^a'}]
+
+    manifest = FileManifest(manifest_path)
+    manifest.record(str(document), "v1")
+    manifest.set_entities(entities)
+    manifest.save()
+
+    # A rescan in a new process skips the file, but gets its entities back
+    rescan = FileManifest(manifest_path)
+    assert rescan.filter_changed([str(document)], "v1") == []
+    assert rescan.entities == entities
+
+
+def test_manifest_without_entities_is_not_used(tmp_path):
+    manifest_path = tmp_path / "file_manifest.json"
+    document = tmp_path / "sopimus.txt"
+    document.write_text("Matti Virtanen", encoding='utf-8')
+    old = FileManifest(str(manifest_path))
+    old.record(str(document), "v1")
+    manifest_path.write_text(json.dumps(old.entries), encoding='utf-8')
+
+    manifest = FileManifest(str(manifest_path))
+    assert manifest.filter_changed([str(document)], "v1") == [str(document)]
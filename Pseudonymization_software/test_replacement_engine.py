@@ -0,0 +1,72 @@
+import random
+import re
+
+from replacement_engine import ReplacementEngine
+
+
+def brute_force(text, replacements):
+    """Leftmost-longest replacement with a regex of the words, longest first."""
+    words = sorted(replacements, key=len, reverse=True)
+    if not words:
+        return text
+    return re.sub("|".join(re.escape(word) for word in words), lambda match: replacements[match.group(0)], text)
+
+
+def replace_streamed(engine, text, cuts):
+    stream = engine.stream()
+    parts, previous = [], 0
+    for cut in sorted(cuts) + [len(text)]:
+        parts.append(stream.feed(text[previous:cut]))
+        previous = cut
+    parts.append(stream.finish())
+    return "".join(parts), stream.matches
+
+
+def test_longest_match_wins_for_nested_keys():
+    engine = ReplacementEngine({"Matti": "^a", "Matti Virtanen": "^b", "Virtanen": "^c"})
+    text, matches = engine.replace("Matti Virtanen ja Matti sekä Virtanen")
+    assert text == "^b ja ^a sekä ^c"
+    assert matches == [(0, 14, "Matti Virtanen"), (18, 23, "Matti"), (29, 37, "Virtanen")]
+
+
+def test_overlapping_keys_are_replaced_leftmost_first():
+    engine = ReplacementEngine({"Oy Rakennus": "^x", "Rakennus Ab": "^y"})
+    assert engine.replace("Oy Rakennus Ab")[0] == "^x Ab"
+    assert engine.replace("Rakennus Ab Oy")[0] == "^y Oy"
+
+
+def test_replacements_are_not_rewritten():
+    # A replacement containing another entity word is written out as it is, unlike repeated str.replace calls
+    engine = ReplacementEngine({"Espoo": "^vantaa", "vantaa": "^turku"})
+    assert engine.replace("Espoo ja vantaa")[0] == "^vantaa ja ^turku"
+
+
+def test_matches_ignore_word_boundaries_and_case_like_str_replace():
+    engine = ReplacementEngine({"Espoo": "^turku"})
+    assert engine.replace("Espoossa ja espoossa, Espoo.")[0] == "^turkussa ja espoossa, ^turku."
+
+
+def test_streamed_input_matches_a_whole_text_pass():
+    engine = ReplacementEngine({"Matti Virtanen": "^b", "Matti": "^a", "tti V": "^c", "Virtanen Oy": "^d"})
+    text = "Matti Virtanen Oy ja Matti Virtanen, Matti. " * 3
+    whole = engine.replace(text)
+    for cuts in ([1], [5, 6, 7], [13, 14, 15, 40], list(range(1, len(text), 3)), list(range(1, len(text)))):
+        assert replace_streamed(engine, text, cuts) == whole
+
+
+def test_random_texts_match_brute_force():
+    rng = random.Random(0)
+    for _ in range(500):
+        words = {"".join(rng.choice("abc ") for _ in range(rng.randint(1, 5))) for _ in range(rng.randint(0, 6))}
+        replacements = {word: f"<{ind}>" for ind, word in enumerate(sorted(words))}
+        text = "".join(rng.choice("abc ") for _ in range(rng.randint(0, 60)))
+        engine = ReplacementEngine(replacements)
+        expected = brute_force(text, replacements)
+        assert engine.replace(text)[0] == expected
+        cuts = sorted(rng.sample(range(1, len(text)), min(len(text) - 1, rng.randint(0, 5)))) if len(text) > 1 else []
+        assert replace_streamed(engine, text, cuts)[0] == expected
+
+
+def test_empty_engine_returns_text_unchanged():
+    assert ReplacementEngine({}).replace("Matti") == ("Matti", [])
+    assert ReplacementEngine({"": "^x"}).replace("Matti") == ("Matti", [])